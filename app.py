@@ -1,32 +1,40 @@
 import streamlit as st
 import os
-from io import BytesIO
+import time
 from dotenv import load_dotenv
-import requests # New import for geocoding
-
-from services.envirotrust import (
-    get_risk_score,
-    get_air_quality_daily,
-    get_air_quality_monthly,
-    get_flood_zone_current,
-    get_wildfire_current,
-    get_wildfire_timeseries,
-    get_heat_wind_daily,
-    get_heat_wind_timeseries,
-)
-from services.ai_writer import AIWriter
-from viz.charts import (
-    plot_risk_score_bar,
-    plot_air_quality_gauges,
-    plot_wildfire_timeseries,
-    plot_heat_wind_scenarios,
-    plot_recent_daily_weather,
-)
-from report.pdf_builder import build_pdf
+
+import jobs
+from utils import metrics
 
 load_dotenv()
 ENVIROTRUST_API_KEY = os.getenv("ENVIROTRUST_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+
+@st.cache_resource
+def _metrics_server(port):
+    """Started once per Streamlit server process, not on every rerun."""
+    # Reports run in worker processes, which push their metrics to the jobs database.
+    return metrics.start_http_server(port, collect=jobs.collect_metrics)
+
+
+if METRICS_PORT:
+    _metrics_server(int(METRICS_PORT))
+
+# Reports run in worker processes (see jobs.py). Set JOBS_WORKERS=0 when workers are
+# started separately with `python jobs.py worker`.
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+POLL_SECONDS = 1.0
+
+
+@st.cache_resource
+def _job_workers(n):
+    return jobs.start_workers(n)
+
+
+if JOBS_WORKERS:
+    _job_workers(JOBS_WORKERS)
 
 st.set_page_config(page_title="ClimateLens – Climate Risk Report", page_icon="🌍", layout="centered")
 st.title("ClimateLens – Climate & ESG Report Generator 🌍")
@@ -35,116 +43,90 @@ if not ENVIROTRUST_API_KEY:
     st.error("Missing ENVIROTRUST_API_KEY in your .env file. See README.")
     st.stop()
 
-# New geocoding function
-def geocode_address(address):
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": address,
-        "format": "json",
-        "limit": 1
-    }
-    headers = {
-        "User-Agent": "ClimateLensApp/1.0 (https://yourwebsite.com/contact)" # User should replace with actual contact info
-    }
-    try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        data = response.json()
-        if data:
-            lat = float(data[0]["lat"])
-            lon = float(data[0]["lon"])
-            return lat, lon
-        else:
-            return None, None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Geocoding API error: {e}")
-        return None, None
-    except ValueError:
-        st.error("Could not parse geocoding response.")
-        return None, None
-
 with st.form("address_form"):
     address = st.text_input("Enter Address", "Marienplatz, Munich, Germany")
+    refresh_narrative = st.checkbox("Regenerate the AI narrative instead of reusing a cached one")
     submitted = st.form_submit_button("Generate Report")
 
+# The job id survives reruns, so the page keeps following the same report.
 if submitted:
-    lat, lon = geocode_address(address)
-    if lat is None or lon is None:
-        st.error("Could not find coordinates for the given address. Please try a different address.")
-        st.stop()
-else:
+    st.session_state["job_id"] = jobs.submit(address, refresh_narrative=refresh_narrative)
+
+job_id = st.session_state.get("job_id")
+if not job_id:
     st.info("Enter an address and click **Generate Report**.")
     st.stop()
 
+STAGE_LABELS = {
+    "starting": "Starting...",
+    "locate": "Locating address...",
+    "fetch": "Fetching climate data...",
+    "narrative": "Rendering charts and generating AI narrative... (This may take a moment.)",
+    "pdf": "Building PDF...",
+}
+
 # -------------------------
-# Fetch data
+# Follow the job
 # -------------------------
-with st.spinner("Fetching climate data..."):
-    try:
-        risk_score = get_risk_score(lat, lon)
-        aq_daily = get_air_quality_daily(lat, lon)
-        aq_monthly = get_air_quality_monthly(lat, lon)
-        flood_zone = get_flood_zone_current(lat, lon)
-        wildfire_now = get_wildfire_current(lat, lon)
-        wildfire_ts = get_wildfire_timeseries(lat, lon)
-        heatwind_daily = get_heat_wind_daily(lat, lon)
-        heatwind_ts = get_heat_wind_timeseries(lat, lon)
-    except Exception as e:
-        st.error(f"Failed to fetch data: {e}")
+# Charts and narrative sections are shown as soon as the worker records them.
+status_box = st.empty()
+warnings_shown, charts_shown, sections_shown = set(), set(), set()
+while True:
+    job = jobs.get(job_id)
+    if job is None:
+        st.session_state.pop("job_id", None)
+        st.error("This report is no longer available. Please generate it again.")
         st.stop()
 
-st.success("Data retrieved ✅")
+    for warning in job["warnings"]:
+        if warning not in warnings_shown:
+            warnings_shown.add(warning)
+            st.warning(warning)
 
-# -------------------------
-# Make charts (saved to temp files)
-# -------------------------
-with st.spinner("Rendering charts... (This may take a moment for AI narrative generation.)"):
-    chart_paths = {}
-    chart_paths["risk_bar"] = plot_risk_score_bar(risk_score)
-    chart_paths["aq_gauges"] = plot_air_quality_gauges(aq_daily)
-    chart_paths["wildfire_ts"] = plot_wildfire_timeseries(wildfire_ts)
-    chart_paths["heatwind_scen"] = plot_heat_wind_scenarios(heatwind_ts)
-    chart_paths["recent_daily"] = plot_recent_daily_weather(heatwind_daily)
-
-st.subheader("Preview")
-for p in chart_paths.values():
-    st.image(p, use_column_width=True)
+    new_charts = [name for name in job["charts"] if name not in charts_shown]
+    if new_charts and not charts_shown:
+        st.success("Data retrieved ✅")
+        st.subheader("Preview")
+    for name in new_charts:
+        charts_shown.add(name)
+        st.image(jobs.chart_path(job_id, name), use_column_width=True)
 
-# -------------------------
-# AI Narrative
-# -------------------------
-with st.spinner("Generating AI narrative... (This may take a moment for AI narrative generation.)"):
-    ai = AIWriter(openai_api_key=OPENAI_API_KEY)
-    narrative = ai.generate_sections(
-        lat=lat,
-        lon=lon,
-        address=address,
-        risk_score=risk_score,
-        flood_zone=flood_zone,
-        wildfire_now=wildfire_now,
-        **chart_paths
-    )
+    for key, section in job["narrative"].items():
+        if key not in sections_shown:
+            sections_shown.add(key)
+            st.write({key: section})
 
-st.success("Narrative ready ✍️")
-st.write(narrative)
+    if job["status"] == "queued":
+        status_box.info("Waiting for a free worker...")
+    elif job["status"] == "running":
+        status_box.info(STAGE_LABELS.get(job["stage"], "Working..."))
+    else:
+        break
+    time.sleep(POLL_SECONDS)
 
-# -------------------------
-# Build PDF
-# -------------------------
-with st.spinner("Building PDF... (This may take a moment for AI narrative generation.)"):
-    pdf_bytes = build_pdf(
-        lat=lat,
-        lon=lon,
-        address=address,
-        risk_score=risk_score,
-        flood_zone=flood_zone,
-        charts=chart_paths,
-        narrative=narrative,
+status_box.empty()
+if job["status"] == "failed":
+    st.error(f"Report generation failed: {job['error']}")
+    st.stop()
+
+def _resubmit(params):
+    # A callback, so the new job id is in place before the page reruns.
+    st.session_state["job_id"] = jobs.submit(
+        params["address"], params["lat"], params["lon"], refresh_narrative=params["refresh_narrative"]
     )
 
-st.download_button(
-    label="⬇️ Download Climate & ESG Report (PDF)",
-    data=pdf_bytes,
-    file_name="climate_esg_report.pdf",
-    mime="application/pdf",
-)
\ No newline at end of file
+
+if job["report_path"] is None:
+    # Done, but the PDF has been purged or deleted since.
+    st.error("The PDF of this report is no longer available.")
+    st.button("Generate it again", on_click=_resubmit, args=(job["params"],))
+    st.stop()
+
+st.success("Narrative ready ✍️")
+with open(job["report_path"], "rb") as f:
+    st.download_button(
+        label="⬇️ Download Climate & ESG Report (PDF)",
+        data=f,
+        file_name="climate_esg_report.pdf",
+        mime="application/pdf",
+    )
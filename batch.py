@@ -0,0 +1,390 @@
+"""
+Headless portfolio report generation.
+
+    python batch.py addresses.csv --out reports/
+
+The input is a CSV with an "address" column or a JSONL file with one object per line.
+Optional "id", "lat" and "lon" fields are used when present. One PDF per address is
+written to the output directory, and every outcome is appended to manifest.jsonl
+there. Re-running the same command skips addresses that already succeeded.
+
+Geocoding, data fetching and the AI narrative are I/O bound and run on a bounded
+thread pool; chart rendering and PDF layout are CPU bound and run on a process pool.
+
+Every address without coordinates is geocoded first, once per distinct address.
+With --tile-precision, nearby properties share EnviroTrust data: addresses are
+grouped into spatial tiles (utils/spatial.py) and each tile is fetched once, at its
+center, which the manifest and the report then name. Off by default, so every
+report describes its own location.
+
+With --archive portfolio.zip, every report is also appended to one ZIP archive as it
+is written, so the portfolio can be handed over as a single file.
+"""
+import os
+import re
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+
+import pipeline
+from utils import metrics
+from utils.spatial import TileIndex, TILE_PRECISION, TILE_SNAP
+from report.profiles import PDF_PROFILES, PDF_PROFILE
+from report.portfolio import PortfolioArchive
+from services.geocoding import geocode_many
+from services.ai_writer import AIWriter, LLM_BACKEND, STRUCTURED_OUTPUT, make_backend, narrative_cache_stats
+
+MANIFEST_NAME = "manifest.jsonl"
+PROGRESS_EVERY = 10
+
+
+# -------------------------
+# Input / manifest
+# -------------------------
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-").lower()[:80] or "report"
+
+
+def read_addresses(path):
+    """Read a CSV or JSONL portfolio into a list of {"id", "address", "lat", "lon"} rows."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    rows, seen = [], set()
+    for i, rec in enumerate(records, start=1):
+        address = (rec.get("address") or "").strip()
+        if not address:
+            logging.warning(f"Skipping input record {i}: no address")
+            continue
+        row_id = str(rec.get("id") or f"{i:05d}-{_slug(address)}")
+        if row_id in seen:
+            logging.warning(f"Skipping input record {i}: duplicate id {row_id}")
+            continue
+        seen.add(row_id)
+        rows.append({
+            "id": row_id,
+            "address": address,
+            "lat": float(rec["lat"]) if rec.get("lat") not in (None, "") else None,
+            "lon": float(rec["lon"]) if rec.get("lon") not in (None, "") else None,
+        })
+    return rows
+
+
+def load_manifest(path):
+    """Return id -> report path of the reports written successfully by a previous run."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # partially written line from an interrupted run
+            if entry.get("status") == "ok" and os.path.exists(entry.get("path", "")):
+                done[entry["id"]] = entry["path"]
+            elif entry.get("status") == "failed":
+                done.pop(entry["id"], None)
+    return done
+
+
+# -------------------------
+# Shared tile fetches
+# -------------------------
+class TileFetches:
+    """
+    Fetches each tile of a TileIndex once, at its center, and hands the payloads to
+    every row in it. A tile's result is dropped once all of its rows have taken it.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.fetched = 0
+        self._remaining = {tile: len(members) for tile, members in index.tiles.items()}
+        self._locks = {tile: threading.Lock() for tile in index.tiles}
+        self._results = {}
+
+    def get(self, tile):
+        """(data, errors) as returned by pipeline.fetch_payloads; raises its error for every row."""
+        with self._locks[tile]:
+            if tile not in self._results:
+                lat, lon = self.index.center(tile)
+                self.fetched += 1
+                try:
+                    self._results[tile] = (pipeline.fetch_payloads(lat, lon), None)
+                except Exception as e:
+                    self._results[tile] = (None, e)
+            result, error = self._results[tile]
+            self._remaining[tile] -= 1
+            if not self._remaining[tile]:
+                del self._results[tile]
+        if error is not None:
+            raise error
+        return result
+
+
+def locate_rows(rows):
+    """
+    Coordinates for every row; returns (located rows, {row id: error}). Addresses without
+    coordinates are geocoded together, once per distinct address (geocoding.geocode_many).
+    """
+    missing = [row["address"] for row in rows if row["lat"] is None or row["lon"] is None]
+    coords, geocode_error = {}, None
+    if missing:
+        try:
+            coords = geocode_many(missing)
+        except Exception as e:
+            geocode_error = e
+
+    located, errors = [], {}
+    for row in rows:
+        try:
+            if row["lat"] is not None and row["lon"] is not None:
+                lat, lon = pipeline.locate(row["address"], row["lat"], row["lon"])
+            elif geocode_error is not None:
+                raise geocode_error
+            else:
+                lat, lon = coords[row["address"]]
+                if lat is None or lon is None:
+                    raise pipeline.PipelineError(f"Could not find coordinates for address: {row['address']}")
+        except Exception as e:
+            errors[row["id"]] = e
+            continue
+        located.append(dict(row, lat=lat, lon=lon))
+    return located, errors
+
+
+# -------------------------
+# Stages
+# -------------------------
+def prepare_job(row, writer, tiles=None):
+    """I/O stage: geocode, fetch (once per tile when `tiles` is given) and write the narrative."""
+    lat, lon = pipeline.locate(row["address"], row["lat"], row["lon"])
+    data_location = None
+    if tiles is not None:
+        data, _ = tiles.get(row["tile"])
+        data_location = tiles.index.center(row["tile"])
+    else:
+        data, _ = pipeline.fetch_payloads(lat, lon)
+    narrative = pipeline.write_narrative(row["address"], lat, lon, data, writer=writer)
+    return {"address": row["address"], "lat": lat, "lon": lon, "data": data, "narrative": narrative,
+            "data_location": data_location}
+
+
+def render_job(job, out_path, profile=None):
+    """
+    CPU stage, run in a worker process: render charts and lay out the PDF. Returns the
+    path and the metrics recorded in the worker, for the parent to merge.
+    """
+    # Reports already run in parallel across processes; don't fan out again.
+    charts = pipeline.render_charts(job["data"], parallel=False, profile=profile)
+    pipeline.assemble_pdf(
+        job["address"], job["lat"], job["lon"], job["data"], charts, job["narrative"], profile=profile, out=out_path,
+        data_location=job["data_location"],
+    )
+    return out_path, metrics.REGISTRY.drain()
+
+
+# -------------------------
+# Driver
+# -------------------------
+def run_batch(rows, out_dir, io_workers=8, cpu_workers=None, writer=None,
+              tile_precision=TILE_PRECISION, tile_snap=TILE_SNAP, pdf_profile=None, archive=None):
+    """
+    Generate reports for `rows`, resuming from the manifest in `out_dir`. Returns counts.
+    With a `tile_precision`, rows in the same spatial tile share one EnviroTrust fetch.
+    `pdf_profile` names the PDF output profile (see report/profiles.py). With an
+    `archive` path, every report is also appended to that ZIP as soon as it is written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    finished = load_manifest(manifest_path)
+    pending = [row for row in rows if row["id"] not in finished]
+    logging.info(f"{len(rows)} addresses, {len(rows) - len(pending)} already done, {len(pending)} to generate")
+
+    portfolio = PortfolioArchive(archive) if archive else contextlib.nullcontext()
+    if archive:
+        # Reports of earlier runs that aren't in the archive yet, e.g. after it was started over.
+        missing = [path for path in finished.values() if os.path.basename(path) not in portfolio]
+        logging.info(f"Appending reports to {archive} ({len(portfolio)} already in it, {len(missing)} to re-add)")
+        for path in missing:
+            portfolio.add_file(path)
+
+    writer = writer or AIWriter()
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    # Bound how many reports are in memory at once, across both stages.
+    max_in_flight = io_workers + 2 * cpu_workers
+    counts = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+    tiles = None
+    in_flight = {}  # future -> (stage, row, submitted_at)
+
+    # Render processes load the chart and PDF libraries as they start (see pipeline.prewarm).
+    cpu_pool = ProcessPoolExecutor(cpu_workers, initializer=pipeline.prewarm, initargs=(True, True, pdf_profile))
+    with ThreadPoolExecutor(io_workers) as io_pool, cpu_pool, portfolio, \
+            open(manifest_path, "a", encoding="utf-8") as manifest:
+        # Start them now, so they warm up while the first reports are geocoded and fetched.
+        for _ in range(cpu_workers):
+            cpu_pool.submit(int)
+
+        def record(row, status, submitted_at, path=None, error=None):
+            counts[status] += 1
+            entry = {"id": row["id"], "address": row["address"], "status": status,
+                     "seconds": round(time.perf_counter() - submitted_at, 3)}
+            if row.get("tile"):
+                entry["tile"] = row["tile"]
+                # Where the report's climate data was fetched.
+                entry["tile_center"] = list(TileIndex.center(row["tile"]))
+            if path:
+                entry["path"] = path
+            if error:
+                entry["error"] = error
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+
+            done = counts["ok"] + counts["failed"]
+            if status == "failed":
+                logging.warning(f"{row['id']} failed: {error}")
+            if done % PROGRESS_EVERY == 0 or done == len(pending):
+                elapsed = time.perf_counter() - started
+                logging.info(
+                    f"[{done}/{len(pending)}] {counts['ok']} ok, {counts['failed']} failed, "
+                    f"{done / elapsed:.2f} reports/s"
+                )
+
+        def add_to_archive(row, path):
+            name = os.path.basename(path)
+            if name in portfolio:
+                # A report regenerated after its PDF was deleted; ZIP entries can't be replaced.
+                logging.warning(f"{row['id']}: {archive} already has {name} from an earlier run, keeping that copy")
+                return
+            try:
+                portfolio.add_file(path, name)
+            except Exception as e:
+                logging.warning(f"{row['id']} could not be added to {archive}: {e}")
+
+        def top_up():
+            while len(in_flight) < max_in_flight:
+                row = next(row_iter, None)
+                if row is None:
+                    return
+                in_flight[io_pool.submit(prepare_job, row, writer, tiles)] = ("prepare", row, time.perf_counter())
+
+        located, errors = locate_rows(pending)
+        for row in pending:
+            if row["id"] in errors:
+                record(row, "failed", started, error=f"locate: {errors[row['id']]}")
+        queue = located
+        if tile_precision and located:
+            index = TileIndex([(row["lat"], row["lon"]) for row in located], tile_precision, tile_snap)
+            for row, tile in zip(located, index.tile_of):
+                row["tile"] = tile
+            # Rows of a tile run back to back, so its payloads are only held briefly.
+            order = {tile: i for i, tile in enumerate(index.tiles)}
+            queue = sorted(located, key=lambda row: order[row["tile"]])
+            tiles = TileFetches(index)
+            stats = index.stats()
+            logging.info(
+                f"{stats['points']} addresses in {stats['tiles']} spatial tiles, dedup ratio "
+                f"{stats['dedup_ratio']:.1f}x (largest tile {stats['largest_tile']})"
+            )
+        row_iter = iter(queue)
+
+        top_up()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, row, submitted_at = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    record(row, "failed", submitted_at, error=f"{stage}: {e}")
+                    continue
+                if stage == "prepare":
+                    out_path = os.path.join(out_dir, f"{row['id']}.pdf")
+                    in_flight[cpu_pool.submit(render_job, result, out_path, pdf_profile)] = ("render", row, submitted_at)
+                else:
+                    path, worker_metrics = result
+                    metrics.REGISTRY.merge(worker_metrics)
+                    record(row, "ok", submitted_at, path=path)
+                    # After the manifest entry, so an interrupted run re-adds rather than duplicates it.
+                    if archive:
+                        add_to_archive(row, path)
+            top_up()
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Finished {counts['ok']} ok, {counts['failed']} failed in {elapsed:.1f}s")
+    if tiles is not None:
+        logging.info(f"EnviroTrust fetched for {tiles.fetched} tiles instead of {len(tiles.index.tile_of)} addresses")
+    stats = narrative_cache_stats()
+    logging.info(
+        f"Narrative cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['tokens_saved']} tokens and {stats['seconds_saved']:.1f}s of API time saved"
+    )
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ClimateLens reports for a portfolio of addresses.")
+    parser.add_argument("input", help="CSV with an 'address' column, or JSONL")
+    parser.add_argument("--out", default="reports", help="output directory for PDFs and the manifest")
+    parser.add_argument("--io-workers", type=int, default=8, help="concurrent geocode/fetch/LLM jobs")
+    parser.add_argument("--cpu-workers", type=int, default=None, help="chart/PDF processes (default: CPU count)")
+    parser.add_argument("--per-section", action="store_true",
+                        help="request each narrative section separately and concurrently")
+    parser.add_argument("--llm-backend", choices=["openai", "offline"], default=LLM_BACKEND,
+                        help="'offline' writes deterministic stand-in narratives without an API key")
+    parser.add_argument("--structured-output", action="store_true",
+                        help="constrain the narrative to a strict JSON schema on the API side")
+    parser.add_argument("--no-narrative-cache", action="store_true", help="neither read nor write the narrative cache")
+    parser.add_argument("--refresh-narratives", action="store_true",
+                        help="regenerate every narrative and overwrite its cache entry")
+    parser.add_argument("--tile-precision", type=int, default=TILE_PRECISION,
+                        help="share EnviroTrust fetches between addresses in geohash cells of this precision "
+                             "(7 is about 150 m); 0, the default, fetches every address")
+    parser.add_argument("--tile-snap", type=float, default=TILE_SNAP,
+                        help="also merge cells within this many meters of a busier cell into its tile (default 0)")
+    parser.add_argument("--pdf-profile", choices=list(PDF_PROFILES), default=PDF_PROFILE,
+                        help="'light' and 'draft' downsample and re-encode charts; 'vector' embeds them as SVG")
+    parser.add_argument("--archive", help="also append every report to this ZIP file as it finishes")
+    parser.add_argument("--metrics-out", help="write stage metrics in Prometheus text format to this file")
+    parser.add_argument("--metrics-port", type=int, help="serve stage metrics on http://0.0.0.0:PORT/metrics")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not os.getenv("ENVIROTRUST_API_KEY"):
+        parser.error("Missing ENVIROTRUST_API_KEY in your environment or .env file.")
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    rows = read_addresses(args.input)
+    writer = AIWriter(
+        backend=make_backend(args.llm_backend),
+        per_section=args.per_section,
+        use_cache=not args.no_narrative_cache,
+        refresh=args.refresh_narratives,
+        structured_output=args.structured_output or STRUCTURED_OUTPUT,
+    )
+    counts = run_batch(
+        rows, args.out, io_workers=args.io_workers, cpu_workers=args.cpu_workers, writer=writer,
+        tile_precision=args.tile_precision, tile_snap=args.tile_snap, pdf_profile=args.pdf_profile,
+        archive=args.archive,
+    )
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(metrics.export_prometheus())
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark: how long each entry point takes to import in a fresh
+interpreter, and how long pipeline.prewarm() then takes.
+
+    python benchmarks/bench_imports.py [--repeat 5] [--top 10] [--out results.json]
+
+Every measurement runs in its own subprocess, so nothing is already imported. With
+--top, the heaviest imports of each module (by `python -X importtime`) are listed too.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py is left out: it runs the Streamlit page when imported.
+MODULES = ["utils.metrics", "services.envirotrust", "services.ai_writer", "pipeline", "batch", "jobs",
+           "viz.charts", "report.pdf_builder"]
+# Libraries whose import is deferred to the stages that use them.
+HEAVY = ["openai", "matplotlib", "seaborn", "pandas", "fpdf"]
+
+_TIMER = """
+import sys, time, json
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _run(body, env=None):
+    out = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(body=body, heavy=HEAVY)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True, env=env,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(body, repeat, env=None):
+    runs = [_run(body, env) for _ in range(repeat)]
+    ms = np.array([r["seconds"] for r in runs]) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 1), "min_ms": round(float(ms.min()), 1),
+            "heavy_loaded": runs[-1]["heavy"]}
+
+
+def heaviest_imports(module, top):
+    """(cumulative ms, name) of the `top` heaviest top-level packages imported by `module`."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT, capture_output=True, text=True
+    ).stderr
+    totals = {}
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        # Nested one level below `module` (a space, then two per level): its direct imports.
+        if name.startswith("   ") and not name.startswith("     ") and cumulative.strip().isdigit():
+            totals[name.strip()] = int(cumulative) / 1000
+    return sorted(((ms, name) for name, ms in totals.items()), reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=0, help="also list the N heaviest imports per module")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+
+    rows = []
+    print(f"{'import':<22} {'p50 ms':>8} {'min ms':>8}  heavy libraries loaded")
+    for module in MODULES:
+        stats = measure(f"import {module}", args.repeat, env)
+        rows.append({"import": module, **stats})
+        print(f"{module:<22} {stats['p50_ms']:>8.1f} {stats['min_ms']:>8.1f}  {', '.join(stats['heavy_loaded']) or '-'}")
+        for ms, name in heaviest_imports(module, args.top) if args.top else []:
+            print(f"    {name:<30} {ms:>8.1f} ms")
+    stats = measure("import logging; logging.disable(logging.INFO)\nimport pipeline; pipeline.prewarm()",
+                    args.repeat, env)
+    rows.append({"import": "pipeline + prewarm()", **stats})
+    print(f"{'pipeline + prewarm()':<22} {stats['p50_ms']:>8.1f} {stats['min_ms']:>8.1f}  "
+          f"{', '.join(stats['heavy_loaded'])}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
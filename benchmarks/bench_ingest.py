@@ -0,0 +1,110 @@
+"""
+Timeseries ingestion benchmark: time and peak Python memory to fetch and normalize the
+EnviroTrust timeseries payloads, read with r.json(), parsed incrementally, and parsed
+incrementally keeping only the trailing daily window.
+
+    python benchmarks/bench_ingest.py [--iterations 5] [--sizes 1,10,50] [--out results.json]
+
+Payloads come from the recorded fixtures (served by benchmarks/mock_server.py), grown
+`size` times to stand in for longer history windows. "peak KB" is the highest peak
+of any one payload, "daily KB" that of the two daily series, which the window trims
+while they are parsed. "rows" is how many rows the charts are drawn from after
+downsampling. Streaming is forced on for every response size here (STREAM_MIN_BYTES 0).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_server import MockServer
+from bench_pipeline import configure_environment, git_commit, _int_list
+
+LAT, LON = 48.1374, 11.5755
+
+
+def ingest(envirotrust, normalize, days, peaks=None):
+    """
+    Fetch and normalize every timeseries payload; returns the number of chart rows. With
+    tracemalloc running, `peaks` collects each payload's peak traced memory by name.
+    """
+    def fetch(name, get, *args, **kwargs):
+        if peaks is not None:
+            tracemalloc.reset_peak()
+        payload = get(LAT, LON, *args, **kwargs)
+        if peaks is not None:
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+        return payload
+
+    frames = [
+        normalize.recent_daily(fetch("heatwind_daily", envirotrust.get_heat_wind_daily, days=days)),
+        normalize.wildfire_timeseries(fetch("wildfire_ts", envirotrust.get_wildfire_timeseries)),
+        normalize.heat_wind_scenarios(fetch("heatwind_ts", envirotrust.get_heat_wind_timeseries)),
+    ]
+    normalize.air_quality_latest(fetch("aq_daily", envirotrust.get_air_quality_daily, days=days))
+    fetch("aq_monthly", envirotrust.get_air_quality_monthly)
+    return sum(len(df) for df in frames)
+
+
+def run(server, sizes, iterations):
+    from services import envirotrust, normalize
+
+    modes = {
+        "r.json()": (False, 0),
+        "stream": (True, 0),
+        "stream+window": (True, envirotrust.DAILY_WINDOW),
+    }
+    envirotrust.STREAM_MIN_BYTES = 0
+    rows = []
+    print(f"{'size':>5} {'mode':<14} {'p50 ms':>8} {'peak KB':>9} {'daily KB':>9} {'rows':>6}")
+    for size in sizes:
+        server.scale = size
+        for mode, (stream, days) in modes.items():
+            envirotrust.STREAM_ENABLED = stream
+            ingest(envirotrust, normalize, days)  # warm the server's scaled payloads
+            durations = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                ingest(envirotrust, normalize, days)
+                durations.append(time.perf_counter() - start)
+            peaks = {}
+            tracemalloc.start()
+            chart_rows = ingest(envirotrust, normalize, days, peaks)
+            tracemalloc.stop()
+            peak, daily = max(peaks.values()), max(peaks["heatwind_daily"], peaks["aq_daily"])
+            p50 = round(float(np.percentile(np.array(durations) * 1000, 50)), 2)
+            rows.append({"size": size, "mode": mode, "p50_ms": p50, "peak_bytes": peak, "daily_peak_bytes": daily,
+                         "chart_rows": chart_rows})
+            print(f"{size:>5} {mode:<14} {p50:>8.1f} {peak / 1024:>9.1f} {daily / 1024:>9.1f} {chart_rows:>6}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5, help="timed calls per measurement")
+    parser.add_argument("--sizes", type=_int_list, default=[1, 10, 50], help="payload scale factors")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = MockServer().start()
+    configure_environment(server, "offline")
+    try:
+        rows = run(server, args.sizes, args.iterations)
+    finally:
+        server.stop()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"commit": git_commit(), "args": vars(args)}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
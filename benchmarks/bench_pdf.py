@@ -0,0 +1,86 @@
+"""
+PDF output profile benchmark: file size and build time of the same report under every
+profile in report/profiles.py.
+
+    python benchmarks/bench_pdf.py [--iterations 5] [--size 1] [--out results.json]
+
+Payloads come from the recorded fixtures (served by benchmarks/mock_server.py) and the
+narrative from fixtures/narrative.json. For every profile the charts are rendered in
+that profile's format, then the PDF is built with a cold image cache (every chart
+re-encoded) and a warm one (charts already prepared, as for repeated charts in a batch).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_server import MockServer, load_fixture
+from bench_pipeline import configure_environment, git_commit
+
+
+def timed(fn, iterations, before=None):
+    """(last result, p50 ms) of `iterations` calls; `before` runs untimed ahead of each call."""
+    durations, result = [], None
+    for _ in range(iterations):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return result, round(float(np.percentile(np.array(durations) * 1000, 50)), 2)
+
+
+def run(iterations):
+    import pipeline
+    from report.profiles import PDF_PROFILES
+    from report.pdf_builder import get_report_builder
+
+    lat, lon = pipeline.locate("Marienplatz, Munich, Germany")
+    data, _ = pipeline.fetch_payloads(lat, lon)
+    narrative = load_fixture("narrative.json")
+    builder = get_report_builder()
+    rows = []
+
+    print(f"{'profile':<10} {'size KB':>9} {'vs archival':>12} {'charts ms':>10} {'build ms':>9} {'warm ms':>8}")
+    for name in PDF_PROFILES:
+        charts, chart_ms = timed(lambda: pipeline.render_charts(data, parallel=False, profile=name), iterations)
+        build = lambda: pipeline.assemble_pdf("bench", lat, lon, data, charts, narrative, profile=name)
+        pdf, cold_ms = timed(build, iterations, before=builder.clear_image_cache)
+        _, warm_ms = timed(build, iterations)
+        size = pdf.getbuffer().nbytes
+        rows.append({"profile": name, "bytes": size, "charts_ms": chart_ms, "build_ms": cold_ms, "warm_build_ms": warm_ms})
+        baseline = rows[0]["bytes"]
+        print(f"{name:<10} {size / 1024:>9.1f} {(size - baseline) / baseline * 100:>+11.1f}% "
+              f"{chart_ms:>10.1f} {cold_ms:>9.1f} {warm_ms:>8.1f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5, help="timed calls per measurement")
+    parser.add_argument("--size", type=int, default=1, help="payload scale factor")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = MockServer(scale=args.size).start()
+    configure_environment(server, "offline")
+    try:
+        rows = run(args.iterations)
+    finally:
+        server.stop()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"commit": git_commit(), "args": vars(args)}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Reports per second of the PDF builder, parsing fonts and the logo for every report
+(the old build_pdf behaviour) versus reusing one ReportBuilder.
+
+    python benchmarks/bench_pdf_builder.py [--reports 20]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report.pdf_builder import ReportBuilder
+from viz.charts import render_all_charts
+
+SECTIONS = ["executive_summary", "market_analysis", "climate_and_esg_risks", "final_verdict"]
+SECTION_CHARTS = {
+    "market_analysis": ["wildfire_ts", "heatwind_scen"],
+    "climate_and_esg_risks": ["risk_bar", "aq_gauges", "recent_daily"],
+}
+
+
+def sample_narrative():
+    paragraph = "Flood and wildfire exposure at this address remain moderate under current scenarios. " * 6
+    return {
+        key: {
+            "title": key.replace("_", " ").title(),
+            "subsections": [{
+                "subtitle": "Overview",
+                "paragraphs": [paragraph, paragraph],
+                "bullets": ["Low flood zone classification", "Stable air quality", "Rising heatwave days"],
+                "charts": SECTION_CHARTS.get(key, []),
+            }],
+        }
+        for key in SECTIONS
+    }
+
+
+def sample_charts():
+    inputs = {
+        "risk_bar": {"scores": {"air_quality": 3.4, "flood_risk": 1.2, "wildfire_risk": 0.5}},
+        "aq_gauges": {"air_quality_timeseries": [{"air_quality_index": 42, "pm2_5": 9.5}]},
+        "wildfire_ts": {"wildfire_risk_timeseries_data": {
+            str(year): {"low": year % 40, "high": year % 9} for year in range(2000, 2030, 5)
+        }},
+        "heatwind_scen": {"heat_wind_timeseries_data": [
+            {"year": year, "heatwaves_rcp45": year % 7, "consecutive_dry_days_rcp45": year % 11,
+             "extreme_wind_speed_days_rcp45": year % 5} for year in range(2020, 2100, 10)
+        ]},
+        "recent_daily": {"heat_wind_daily_data": [
+            {"date": f"2024-06-{day:02d}", "max temp(C)": 20 + day % 6, "wind(m/s)": 3 + day % 4}
+            for day in range(1, 31)
+        ]},
+    }
+    charts, _ = render_all_charts(inputs, parallel=False, in_memory=True)
+    return charts
+
+
+def run(label, make_builder, reports, charts, narrative):
+    start = time.perf_counter()
+    for i in range(reports):
+        make_builder().build(48.137, 11.575, f"Marienplatz {i}, Munich", {}, {}, charts, narrative)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {reports / elapsed:6.2f} reports/s  ({elapsed / reports * 1000:.0f} ms/report)")
+    return reports / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    charts, narrative = sample_charts(), sample_narrative()
+    shared = ReportBuilder()
+    before = run("fonts parsed per report", ReportBuilder, args.reports, charts, narrative)
+    after = run("shared ReportBuilder", lambda: shared, args.reports, charts, narrative)
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
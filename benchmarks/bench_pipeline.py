@@ -0,0 +1,213 @@
+"""
+End-to-end pipeline benchmark, replaying recorded EnviroTrust, Nominatim and LLM
+fixtures through a local mock server (benchmarks/mock_server.py).
+
+    python benchmarks/bench_pipeline.py [--iterations 10] [--sizes 1,4,16] [--concurrency 1,4]
+                                        [--out results.json] [--compare baseline.json]
+
+For every payload size each stage is timed on its own (geocode, fetch, each plot_*
+function, narrative, build_pdf), then whole reports are generated at each concurrency
+level. Caches are turned off so every iteration does the full work. Each row reports
+latency p50/p95, throughput and the stage's own peak Python memory; the JSON written
+with --out can be passed to --compare on a later commit.
+
+Peak memory is measured with tracemalloc, reset for each stage, over one extra
+untimed round of `concurrency` calls, so tracing doesn't skew the timings. It covers
+allocations made through Python's allocators (numpy arrays included) in this process,
+not chart worker processes or native buffers such as matplotlib's canvas.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import warnings
+import platform
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_server import MockServer
+
+ADDRESS = "Marienplatz {size}-{i}, Munich, Germany"
+
+
+def peak_traced_mb(fn, concurrency=1):
+    """Peak Python memory allocated, in MB, while `concurrency` fn(i) calls run at once."""
+    tracemalloc.start()
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(fn, range(-concurrency, 0)))
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, iterations, concurrency=1, warmup=1):
+    """Call fn(i) `iterations` times on `concurrency` threads; returns latency/throughput stats."""
+    for i in range(warmup):
+        fn(-1 - i)
+    durations = []
+
+    def timed(i):
+        start = time.perf_counter()
+        fn(i)
+        durations.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(iterations)))
+    wall = time.perf_counter() - start
+
+    ms = np.array(durations) * 1000
+    return {
+        "n": len(durations),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "throughput_per_s": round(len(durations) / wall, 2),
+        "peak_mb": peak_traced_mb(fn, concurrency),
+    }
+
+
+def configure_environment(server, llm_backend):
+    """
+    Point every client at the mock server and turn caches off. The app's modules read
+    these settings when they are imported, so benchmarks call this first and import
+    the app inside their run() functions.
+    """
+    os.environ.update(server.env())
+    os.environ.update({
+        "ENVIROTRUST_API_KEY": "bench",
+        "ENVIROTRUST_CACHE": "0",
+        "GEOCODE_CACHE_PATH": "",
+        "NOMINATIM_RATE": "1000000",
+        "OPENAI_API_KEY": "bench",
+        "LLM_BACKEND": llm_backend,
+        "NARRATIVE_CACHE": "0",
+        "CHART_CACHE_PATH": "",
+        "CHART_CACHE_MAX_BYTES": "0",
+        # Keeps seaborn's deprecation warnings, in chart worker processes too, out of the table.
+        "PYTHONWARNINGS": "ignore",
+    })
+    warnings.simplefilter("ignore")
+
+
+def run(server, sizes, concurrency_levels, iterations):
+    import pipeline
+    from services import envirotrust, geocoding
+    from services.ai_writer import AIWriter
+    from viz.charts import CHART_FUNCTIONS
+
+    writer = AIWriter()
+    rows = []
+
+    def record(stage, size, concurrency, stats):
+        rows.append({"stage": stage, "size": size, "concurrency": concurrency, **stats})
+        print(
+            f"{stage:<22} {size:>4} {concurrency:>4} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} "
+            f"{stats['throughput_per_s']:>9.2f} {stats['peak_mb']:>8.1f}"
+        )
+
+    print(f"{'stage':<22} {'size':>4} {'conc':>4} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>9} {'peak MB':>8}")
+    for size in sizes:
+        server.scale = size
+        lat, lon = pipeline.locate(ADDRESS.format(size=size, i="base"))
+        data, _ = pipeline.fetch_payloads(lat, lon)
+        inputs = {name: data.get(payload, {}) for name, payload in pipeline.CHART_INPUTS.items()}
+        charts = pipeline.render_charts(data, parallel=False)
+        narrative = pipeline.write_narrative("bench", lat, lon, data, writer=writer)
+
+        # Addresses differ per call, so the in-memory geocoding cache never hits.
+        record("geocode", size, 1, measure(
+            lambda i: geocoding.geocode_address(ADDRESS.format(size=size, i=i)), iterations))
+        record("fetch", size, 1, measure(lambda i: envirotrust.fetch_all(lat, lon), iterations))
+        for name, payload in inputs.items():
+            # __wrapped__ is the plot function without the chart cache in front.
+            draw = CHART_FUNCTIONS[name].__wrapped__
+            record(f"chart:{name}", size, 1, measure(lambda i: draw(payload), iterations))
+        record("narrative", size, 1, measure(
+            lambda i: pipeline.write_narrative("bench", lat, lon, data, writer=writer), iterations))
+        record("build_pdf", size, 1, measure(
+            lambda i: pipeline.assemble_pdf("bench", lat, lon, data, charts, narrative), iterations))
+        for concurrency in concurrency_levels:
+            record("report", size, concurrency, measure(
+                lambda i: pipeline.generate_report(ADDRESS.format(size=size, i=f"r{i}"), writer=writer),
+                iterations, concurrency))
+    return rows
+
+
+def compare(rows, baseline_path):
+    """Print the p50 change of every row against an earlier results file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["stage"], r["size"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nComparison with {baseline_path} (p50):")
+    for row in rows:
+        old = baseline.get((row["stage"], row["size"], row["concurrency"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        change = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"{row['stage']:<22} {row['size']:>4} {row['concurrency']:>4} "
+              f"{old['p50_ms']:>10.1f} -> {row['p50_ms']:>10.1f}  {change:+6.1f}%")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10, help="timed calls per stage")
+    parser.add_argument("--sizes", type=_int_list, default=[1, 4, 16], help="payload scale factors")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4], help="concurrent whole reports")
+    parser.add_argument("--latency-ms", type=float, default=20, help="mock EnviroTrust/Nominatim latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="mock LLM latency")
+    parser.add_argument("--llm-backend", choices=["openai", "offline"], default="openai",
+                        help="'openai' goes through the OpenAI client to the mock server")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON from an earlier run to compare against")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = MockServer(latency=args.latency_ms / 1000, llm_latency=args.llm_latency_ms / 1000).start()
+    configure_environment(server, args.llm_backend)
+    try:
+        rows = run(server, args.sizes, args.concurrency, args.iterations)
+    finally:
+        server.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": rows,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Portfolio output benchmark: peak Python memory and time to put N reports into one ZIP,
+collecting in-memory PDFs first versus streaming each one into the archive as it is
+built (report/portfolio.py).
+
+    python benchmarks/bench_portfolio.py [--reports 5,20] [--profile light] [--out results.json]
+
+Charts are rendered once from the recorded fixtures and every report reuses them, so
+the measurement is PDF output and archiving only. Memory is measured with tracemalloc.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import zipfile
+import argparse
+import tempfile
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_server import MockServer, load_fixture
+from bench_pipeline import configure_environment, git_commit, _int_list
+
+
+def collected(pipeline, args, n, path):
+    """The pattern build_pdf's BytesIO leads to: keep every report, then zip them."""
+    pdfs = [pipeline.assemble_pdf(*args) for _ in range(n)]
+    with zipfile.ZipFile(path, "w") as zf:
+        for i, buf in enumerate(pdfs):
+            zf.writestr(f"report-{i}.pdf", buf.getvalue())
+
+
+def streamed(pipeline, args, n, path):
+    from report.portfolio import PortfolioArchive
+
+    with PortfolioArchive(path) as archive:
+        for i in range(n):
+            with archive.entry(f"report-{i}.pdf") as entry:
+                pipeline.assemble_pdf(*args, out=entry)
+
+
+def run(report_counts, profile):
+    import pipeline
+
+    lat, lon = pipeline.locate("Marienplatz, Munich, Germany")
+    data, _ = pipeline.fetch_payloads(lat, lon)
+    charts = pipeline.render_charts(data, parallel=False, profile=profile)
+    args = ("bench", lat, lon, data, charts, load_fixture("narrative.json"), profile)
+    pipeline.assemble_pdf(*args)  # warm the builder's image cache
+
+    rows = []
+    print(f"{'reports':>8} {'mode':<10} {'seconds':>8} {'peak MB':>8} {'zip MB':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in report_counts:
+            for mode, fn in (("collected", collected), ("streamed", streamed)):
+                path = os.path.join(tmp, f"{mode}-{n}.zip")
+                tracemalloc.start()
+                start = time.perf_counter()
+                fn(pipeline, args, n, path)
+                seconds = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                size = os.path.getsize(path)
+                rows.append({"reports": n, "mode": mode, "seconds": round(seconds, 2), "peak_bytes": peak,
+                             "zip_bytes": size})
+                print(f"{n:>8} {mode:<10} {seconds:>8.2f} {peak / 2**20:>8.1f} {size / 2**20:>7.1f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reports", type=_int_list, default=[5, 20], help="reports per archive")
+    parser.add_argument("--profile", default="light", help="PDF output profile")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = MockServer().start()
+    configure_environment(server, "offline")
+    try:
+        rows = run(args.reports, args.profile)
+    finally:
+        server.stop()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"commit": git_commit(), "args": vars(args)}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
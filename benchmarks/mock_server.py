@@ -0,0 +1,229 @@
+"""
+Local stand-in for EnviroTrust, Nominatim and the OpenAI Responses API, replaying the
+recorded payloads in benchmarks/fixtures/.
+
+    python benchmarks/mock_server.py [--port 8765] [--latency-ms 20] [--llm-latency-ms 200] [--scale 1]
+
+Point the app or batch.py at it with:
+
+    ENVIROTRUST_BASE_URL=http://127.0.0.1:8765
+    NOMINATIM_URL=http://127.0.0.1:8765/search
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+
+Timeseries payloads can be grown `scale` times to benchmark larger responses. Only
+non-streaming LLM calls are recorded.
+"""
+import os
+import re
+import copy
+import json
+import time
+import datetime
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_SECTION_RE = re.compile(r'Write ONLY the "([^"]+)" section')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# -------------------------
+# Payload scaling
+# -------------------------
+def _shift_record(rec, step):
+    """Copy of a timeseries record moved `step` periods earlier, by date or by year."""
+    rec = dict(rec)
+    if "date" in rec:
+        day = datetime.date.fromisoformat(rec["date"]) - datetime.timedelta(days=step)
+        rec["date"] = day.isoformat()
+        if "year" in rec:
+            rec["year"] = day.year
+    elif "year" in rec:
+        rec["year"] = int(rec["year"]) - step
+    return rec
+
+
+def scale_payload(payload, factor):
+    """Grow every timeseries in a payload `factor` times, keeping dates and years distinct."""
+    if factor <= 1 or not isinstance(payload, dict):
+        return payload
+    scaled = {}
+    for key, value in payload.items():
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            n = len(value)
+            earlier = [_shift_record(rec, n * r) for r in range(factor - 1, 0, -1) for rec in value]
+            scaled[key] = earlier + value
+        elif isinstance(value, dict) and value and all(isinstance(v, dict) and "year" in v for v in value.values()):
+            # {year label: record}, as in the wildfire timeseries
+            n = len(value)
+            scaled[key] = {}
+            for r in range(factor - 1, -1, -1):
+                for rec in value.values():
+                    rec = _shift_record(rec, n * r)
+                    scaled[key][str(rec["year"])] = rec
+        else:
+            scaled[key] = value
+    return scaled
+
+
+# -------------------------
+# Server
+# -------------------------
+class MockServer:
+    """
+    Threaded HTTP server replaying the fixtures. `latency` and `llm_latency` are added
+    to every API and LLM response respectively, in seconds. `scale` can be changed
+    while the server runs.
+    """
+
+    def __init__(self, port=0, latency=0.0, llm_latency=0.0, scale=1):
+        self.latency = latency
+        self.llm_latency = llm_latency
+        self.scale = scale
+        self.requests = Counter()
+        self._envirotrust = load_fixture("envirotrust.json")
+        self._nominatim = load_fixture("nominatim.json")
+        self._narrative = load_fixture("narrative.json")
+        self._scaled = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        """Environment variables that point the app's clients at this server."""
+        return {
+            "ENVIROTRUST_BASE_URL": self.url,
+            "NOMINATIM_URL": f"{self.url}/search",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def envirotrust_payload(self, path):
+        with self._lock:
+            key = (path, self.scale)
+            if key not in self._scaled:
+                self._scaled[key] = json.dumps(scale_payload(self._envirotrust[path], self.scale)).encode("utf-8")
+            return self._scaled[key]
+
+    def llm_reply(self, prompt):
+        titles = {section["title"]: key for key, section in self._narrative.items()}
+        match = _SECTION_RE.search(prompt)
+        if match and match.group(1) in titles:
+            sec = titles[match.group(1)]
+            return json.dumps({sec: self._narrative[sec]})
+        return json.dumps(self._narrative)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+            # Headers and body are written separately; with Nagle on, small replies wait ~40ms for a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                server.requests[path] += 1
+                time.sleep(server.latency)
+                if path == "/search":
+                    self._send(200, server._nominatim)
+                elif path in server._envirotrust:
+                    self._send(200, server.envirotrust_payload(path))
+                else:
+                    self._send(404, {"detail": f"No fixture for {path}"})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                server.requests[path] += 1
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if path != "/v1/responses":
+                    self._send(404, {"error": {"message": f"No fixture for {path}"}})
+                    return
+                if body.get("stream"):
+                    self._send(400, {"error": {"message": "Streaming responses are not recorded"}})
+                    return
+                time.sleep(server.llm_latency)
+                prompt = body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))
+                text = server.llm_reply(prompt)
+                input_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+                self._send(200, {
+                    "id": "resp_mock",
+                    "object": "response",
+                    "created_at": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "status": "completed",
+                    "parallel_tool_calls": True,
+                    "tool_choice": "auto",
+                    "tools": copy.deepcopy(body.get("tools", [])),
+                    "output": [{
+                        "type": "message",
+                        "id": "msg_mock",
+                        "status": "completed",
+                        "role": "assistant",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}],
+                    }],
+                    "usage": {
+                        "input_tokens": input_tokens,
+                        "input_tokens_details": {"cached_tokens": 0},
+                        "output_tokens": output_tokens,
+                        "output_tokens_details": {"reasoning_tokens": 0},
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded EnviroTrust, Nominatim and LLM fixtures.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=20, help="added to every EnviroTrust/Nominatim response")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="added to every LLM response")
+    parser.add_argument("--scale", type=int, default=1, help="grow timeseries payloads this many times")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency_ms / 1000, args.llm_latency_ms / 1000, args.scale).start()
+    for name, value in server.env().items():
+        print(f"{name}={value}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
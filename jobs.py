@@ -0,0 +1,400 @@
+"""
+Report job queue.
+
+The UI submits a report request and gets a job id back; worker processes claim queued
+jobs from a SQLite table, run the pipeline and write the PDF (and chart previews) to
+JOBS_DIR. Progress, fetch warnings and narrative sections are stored on the job as
+they happen, so the UI can poll and show them. Requests for the same address and
+parameters share one job while it is queued or running.
+
+    python jobs.py worker --workers 4       # run workers (set JOBS_WORKERS=0 for the app)
+    python jobs.py submit "Marienplatz, Munich"
+    python jobs.py status <job id>
+
+A job whose worker stops heartbeating for JOB_LEASE seconds is handed to another
+worker, up to JOB_MAX_ATTEMPTS times.
+
+Stage metrics (utils/metrics.py) recorded in a worker are written to the jobs
+database after every job; collect_metrics() merges them into the registry of the
+process that exports them (the app's METRICS_PORT server).
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import contextlib
+import multiprocessing
+
+from dotenv import load_dotenv
+
+import pipeline
+from services.ai_writer import AIWriter, make_backend
+from services.geocoding import normalize_address
+from report.profiles import get_profile
+from utils import metrics
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "climatelens")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(CACHE_DIR, "jobs.sqlite"))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(CACHE_DIR, "jobs"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+# Finished jobs and their files are deleted after this many seconds.
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# Workers load the chart, PDF and LLM libraries before claiming their first job.
+JOBS_PREWARM = os.getenv("JOBS_PREWARM", "1") != "0"
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "failed")
+# SQL conditions for the two; the jobs_in_flight index only serves queries using IS_ACTIVE verbatim.
+IS_ACTIVE = f"status IN ({', '.join(repr(status) for status in ACTIVE)})"
+IS_FINISHED = f"status IN ({', '.join(repr(status) for status in FINISHED)})"
+_JSON_FIELDS = ("params", "warnings", "charts", "narrative")
+
+_local = threading.local()
+
+
+# -------------------------
+# Storage
+# -------------------------
+def _db():
+    # One connection per thread, reopened after a fork.
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        directory = os.path.dirname(JOBS_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                params TEXT NOT NULL,
+                warnings TEXT NOT NULL DEFAULT '[]',
+                charts TEXT NOT NULL DEFAULT '[]',
+                narrative TEXT NOT NULL DEFAULT '{{}}',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat REAL,
+                finished_at REAL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_in_flight ON jobs (key) WHERE {IS_ACTIVE};
+            CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+@contextlib.contextmanager
+def _transaction():
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def _as_dict(row):
+    job = dict(row)
+    for field in _JSON_FIELDS:
+        job[field] = json.loads(job[field])
+    path = report_path(job["id"])
+    job["report_path"] = path if job["status"] == "done" and os.path.exists(path) else None
+    return job
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def report_path(job_id):
+    return os.path.join(job_dir(job_id), "report.pdf")
+
+
+def chart_path(job_id, name):
+    # SVG under the "vector" PDF profile.
+    return os.path.join(job_dir(job_id), f"{name}.{get_profile()['chart_format']}")
+
+
+# -------------------------
+# Client API
+# -------------------------
+def job_key(params: dict) -> str:
+    """Requests with the same key are served by one in-flight job."""
+    params = dict(params, address=normalize_address(params["address"]))
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def submit(address, lat=None, lon=None, refresh_narrative=False) -> str:
+    """Queue a report and return its job id, or the id of an identical job already in flight."""
+    params = {"address": address, "lat": lat, "lon": lon, "refresh_narrative": bool(refresh_narrative)}
+    key = job_key(params)
+    with _transaction() as db:
+        row = db.execute(f"SELECT id FROM jobs WHERE key = ? AND {IS_ACTIVE}", (key,)).fetchone()
+        if row is not None:
+            logging.info(f"Report for {address!r} already in flight as job {row['id']}")
+            return row["id"]
+        job_id = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO jobs (id, key, status, params, created_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, key, json.dumps(params), time.time()),
+        )
+    logging.info(f"Queued job {job_id} for {address!r}")
+    return job_id
+
+
+def get(job_id):
+    """The job as a dict (JSON fields decoded, plus "report_path" once done), or None."""
+    row = _db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _as_dict(row) if row is not None else None
+
+
+# -------------------------
+# Worker side
+# -------------------------
+def claim(worker):
+    """Take the oldest queued job, or one whose worker stopped heartbeating. Returns it or None."""
+    now = time.time()
+    with _transaction() as db:
+        db.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = COALESCE(error, 'worker stopped responding') "
+            "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+            (now, now - JOB_LEASE, JOB_MAX_ATTEMPTS),
+        )
+        row = db.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) "
+            "ORDER BY created_at LIMIT 1",
+            (now - JOB_LEASE,),
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            "UPDATE jobs SET status = 'running', stage = 'starting', worker = ?, attempts = attempts + 1, "
+            "started_at = ?, heartbeat = ? WHERE id = ?",
+            (worker, now, now, row["id"]),
+        )
+        return _as_dict(db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+
+def _update(job_id, worker, **fields):
+    """Record progress and heartbeat; a no-op once another worker has taken the job over."""
+    fields = {k: json.dumps(v) if k in _JSON_FIELDS else v for k, v in fields.items()}
+    fields["heartbeat"] = time.time()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    _db().execute(
+        f"UPDATE jobs SET {assignments} WHERE id = ? AND worker = ? AND status = 'running'",
+        (*fields.values(), job_id, worker),
+    )
+
+
+def _write_atomic(path, data):
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def run_job(job, worker, writer=None, backend=None):
+    """
+    Run the report stage graph for a claimed job (see pipeline.report_graph), recording
+    progress, chart previews and narrative sections on the job as stages finish.
+    `backend` is an LLM backend to reuse across jobs.
+    """
+    job_id, params = job["id"], job["params"]
+    address = params["address"]
+    writer = writer or AIWriter(refresh=params["refresh_narrative"], backend=backend)
+    payloads = {f"payload:{name}" for name in pipeline.ENDPOINTS}
+    charts, narrative = [], {}
+
+    def on_section(key, section):
+        narrative[key] = section
+        _update(job_id, worker, narrative=narrative)
+
+    def on_done(stage, result):
+        if stage == "locate":
+            _update(job_id, worker, stage="fetch")
+        elif stage.startswith("payload:"):
+            payloads.discard(stage)
+            if not payloads:
+                warnings = [f"Could not fetch {name}, the related chart will be empty: {err}"
+                            for name, err in errors.items()]
+                _update(job_id, worker, stage="narrative", warnings=warnings)
+        elif stage.startswith("chart:"):
+            name = stage.split(":", 1)[1]
+            _write_atomic(chart_path(job_id, name), result)
+            charts.append(name)
+            _update(job_id, worker, charts=charts)
+        elif stage == "narrative":
+            _update(job_id, worker, stage="pdf")
+
+    try:
+        _update(job_id, worker, stage="locate")
+        os.makedirs(job_dir(job_id), exist_ok=True)
+        # Workers already run side by side; render charts on the graph's threads.
+        # The PDF stage writes the report file itself, through a ".part" file.
+        graph, errors = pipeline.report_graph(
+            address, params["lat"], params["lon"], writer=writer, parallel_charts=False, on_section=on_section,
+            out=report_path(job_id),
+        )
+        graph.run(on_done=on_done)
+        graph.log_summary()
+        _update(job_id, worker, status="done", stage=None, finished_at=time.time())
+        logging.info(f"Job {job_id} done")
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed")
+        _update(job_id, worker, status="failed", error=str(e), finished_at=time.time())
+
+
+def push_metrics():
+    """Move the metrics recorded in this process into the jobs database, for collect_metrics()."""
+    state = metrics.REGISTRY.drain()
+    if not state["counters"] and not state["histograms"]:
+        return
+    try:
+        _db().execute("INSERT INTO metrics (state, created_at) VALUES (?, ?)", (json.dumps(state), time.time()))
+    except sqlite3.Error as e:
+        metrics.REGISTRY.merge(state)  # keep them for the next attempt
+        logging.warning(f"Could not store worker metrics: {e}")
+
+
+def collect_metrics():
+    """Merge the metrics workers have pushed into this process's registry, removing them from the database."""
+    with _transaction() as db:
+        rows = db.execute("SELECT state FROM metrics ORDER BY id").fetchall()
+        db.execute("DELETE FROM metrics")
+    for row in rows:
+        state = json.loads(row["state"])
+        # JSON turned the (name, ((label, value), ...)) keys into lists.
+        metrics.REGISTRY.merge({
+            kind: [((name, tuple(map(tuple, labels))), value) for (name, labels), value in state[kind]]
+            for kind in ("counters", "histograms")
+        })
+
+
+def purge(max_age=JOB_RETENTION):
+    """Delete finished jobs older than `max_age` seconds, with their files."""
+    cutoff = time.time() - max_age
+    rows = _db().execute(
+        f"SELECT id FROM jobs WHERE {IS_FINISHED} AND finished_at < ?", (cutoff,)
+    ).fetchall()
+    for row in rows:
+        shutil.rmtree(job_dir(row["id"]), ignore_errors=True)
+        _db().execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+    # Metrics nobody collected, e.g. workers running without an app exporting them.
+    _db().execute("DELETE FROM metrics WHERE created_at < ?", (cutoff,))
+    return len(rows)
+
+
+def work(poll_interval=POLL_INTERVAL, stop=None, prewarm=JOBS_PREWARM, preloaded=False):
+    """
+    Worker loop: claim and run jobs until `stop` (a multiprocessing.Event) is set. With
+    `prewarm`, the chart and PDF libraries (unless `preloaded` by the parent) and the
+    LLM client are loaded first, so the first job doesn't pay for them.
+    """
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    backend = None
+    if prewarm:
+        if not preloaded:
+            pipeline.prewarm()
+        # One client, and connection pool, for every job; created here, after any fork.
+        backend = make_backend()
+    last_purge = 0.0
+    while stop is None or not stop.is_set():
+        job = claim(worker)
+        if job is not None:
+            run_job(job, worker, backend=backend)
+            push_metrics()
+            continue
+        if time.time() - last_purge > 3600:
+            purge()
+            last_purge = time.time()
+        time.sleep(poll_interval)
+
+
+def start_workers(n, stop=None, prewarm=JOBS_PREWARM, preload=False):
+    """
+    Start `n` worker processes; they exit when `stop` is set or with the parent.
+
+    With `preload`, the parent loads the chart and PDF libraries once and forks the
+    workers, which start with them already in (shared, copy-on-write) memory. Only use
+    it from a parent that runs no other threads.
+    """
+    if preload:
+        pipeline.prewarm()
+        ctx = multiprocessing.get_context("fork")
+    else:
+        # spawn: the parent may already run threads (Streamlit), which fork doesn't copy safely.
+        ctx = multiprocessing.get_context("spawn")
+    procs = []
+    for i in range(n):
+        proc = ctx.Process(target=work, kwargs={"stop": stop, "prewarm": prewarm, "preloaded": preload},
+                           name=f"report-worker-{i}", daemon=True)
+        proc.start()
+        procs.append(proc)
+    return procs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ClimateLens report job queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="run worker processes")
+    worker.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    worker.add_argument("--no-prewarm", action="store_true", help="don't load libraries before the first job")
+    worker.add_argument("--preload", action="store_true",
+                        help="load libraries once in this process and fork the workers from it")
+    sub = commands.add_parser("submit", help="queue a report and print its job id")
+    sub.add_argument("address")
+    sub.add_argument("--refresh-narrative", action="store_true")
+    status = commands.add_parser("status", help="print a job as JSON")
+    status.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "submit":
+        print(submit(args.address, refresh_narrative=args.refresh_narrative))
+    elif args.command == "status":
+        job = get(args.job_id)
+        if job is None:
+            parser.error(f"No such job: {args.job_id}")
+        print(json.dumps(job, indent=2))
+    else:
+        stop = multiprocessing.get_context("fork" if args.preload else "spawn").Event()
+        procs = start_workers(args.workers, stop, prewarm=not args.no_prewarm, preload=args.preload)
+        logging.info(f"Started {len(procs)} report workers")
+        try:
+            for proc in procs:
+                proc.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for proc in procs:
+                proc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
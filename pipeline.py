@@ -0,0 +1,247 @@
+import time
+import logging
+import functools
+
+from services.geocoding import geocode_address
+from services.envirotrust import ENDPOINTS, FETCH_DEADLINE, fetch_all, submit_all
+from services.ai_writer import AIWriter
+from report.profiles import get_profile
+from utils import metrics
+from utils.graph import StageGraph
+
+# viz.charts (matplotlib, seaborn, pandas) and report.pdf_builder (fpdf) are imported
+# by the stages that use them, so processes that only fetch or write narratives start
+# quickly. prewarm() loads them ahead of the first report.
+
+# Payloads the narrative can't be written without; the rest only feed charts.
+REQUIRED_PAYLOADS = ("risk_score", "flood_zone", "wildfire_now")
+
+# chart name -> payload it is drawn from
+CHART_INPUTS = {
+    "risk_bar": "risk_score",
+    "aq_gauges": "aq_daily",
+    "wildfire_ts": "wildfire_ts",
+    "heatwind_scen": "heatwind_ts",
+    "recent_daily": "heatwind_daily",
+}
+
+
+class PipelineError(RuntimeError):
+    """A report can't be produced for this address."""
+
+
+# -------------------------
+# Stages
+# -------------------------
+@metrics.traced("pipeline.locate")
+def locate(address, lat=None, lon=None):
+    """Return (lat, lon), geocoding the address unless coordinates are given."""
+    if lat is not None and lon is not None:
+        return float(lat), float(lon)
+    lat, lon = geocode_address(address)
+    if lat is None or lon is None:
+        raise PipelineError(f"Could not find coordinates for address: {address}")
+    return lat, lon
+
+
+@metrics.traced("pipeline.fetch")
+def fetch_payloads(lat, lon):
+    """
+    Fetch every EnviroTrust payload for a location.
+
+    Returns (data, errors). Optional payloads that failed are replaced by {} so their
+    charts render empty; a missing required payload raises PipelineError.
+    """
+    fetched = fetch_all(lat, lon)
+    for name in REQUIRED_PAYLOADS:
+        if name in fetched["errors"]:
+            raise PipelineError(f"Failed to fetch {name}: {fetched['errors'][name]}")
+    for name, err in fetched["errors"].items():
+        logging.warning(f"Could not fetch {name}, the related chart will be empty: {err}")
+    data = {name: fetched["data"].get(name, {}) for name in ENDPOINTS}
+    return data, fetched["errors"]
+
+
+@metrics.traced("pipeline.charts")
+def render_charts(data, parallel=True, profile=None) -> dict:
+    """
+    Render every chart from the fetched payloads; returns chart name -> image bytes,
+    PNG or SVG as the PDF `profile` wants.
+    """
+    from viz.charts import render_all_charts
+
+    inputs = {name: data.get(payload, {}) for name, payload in CHART_INPUTS.items()}
+    fmt = get_profile(profile)["chart_format"]
+    charts, timings = render_all_charts(inputs, parallel=parallel, in_memory=True, fmt=fmt)
+    logging.info("Charts rendered: " + ", ".join(f"{name} {t:.2f}s" for name, t in timings.items()))
+    return charts
+
+
+@metrics.traced("pipeline.narrative")
+def write_narrative(address, lat, lon, data, charts=CHART_INPUTS, writer=None) -> dict:
+    """
+    Generate the AI narrative. Only chart names matter to the prompt, so this can run
+    before the charts are rendered.
+    """
+    writer = writer or AIWriter()
+    return writer.generate_sections(
+        lat=lat,
+        lon=lon,
+        address=address,
+        risk_score=data["risk_score"],
+        flood_zone=data["flood_zone"],
+        wildfire_now=data["wildfire_now"],
+        **{name: True for name in charts}
+    )
+
+
+def stream_narrative(address, lat, lon, data, charts=CHART_INPUTS, writer=None):
+    """Like write_narrative, but yields (section_key, section) as each section finishes streaming."""
+    writer = writer or AIWriter()
+    yield from writer.stream_sections(
+        lat=lat,
+        lon=lon,
+        address=address,
+        risk_score=data["risk_score"],
+        flood_zone=data["flood_zone"],
+        wildfire_now=data["wildfire_now"],
+        **{name: True for name in charts}
+    )
+
+
+@metrics.traced("pipeline.pdf")
+def assemble_pdf(address, lat, lon, data, charts, narrative, profile=None, out=None, data_location=None):
+    """
+    The report PDF as a BytesIO, or written to `out`, a path or binary file-like object.
+    `data_location` is the (lat, lon) `data` was fetched for, when not the property's own.
+    """
+    from report.pdf_builder import build_pdf
+
+    return build_pdf(
+        lat=lat,
+        lon=lon,
+        address=address,
+        risk_score=data["risk_score"],
+        flood_zone=data["flood_zone"],
+        charts=charts,
+        narrative=narrative,
+        profile=profile,
+        out=out,
+        data_location=data_location,
+    )
+
+
+def prewarm(charts=True, pdf=True, profile=None):
+    """
+    Load what the first report would otherwise pay for: matplotlib, seaborn and pandas
+    with the chart style and font caches, and the PDF builder with its fonts parsed
+    and the logo prepared for `profile`. Worker processes call this before taking work.
+    """
+    start = time.perf_counter()
+    if charts:
+        from viz.charts import warm_up
+
+        warm_up()
+    if pdf:
+        from report.pdf_builder import get_report_builder
+
+        get_report_builder().build(0.0, 0.0, "", {}, {}, {}, {}, profile=profile)
+    logging.info(f"Pre-warmed chart and PDF libraries in {time.perf_counter() - start:.2f}s")
+
+
+# -------------------------
+# Stage graph
+# -------------------------
+def _await_payload(name, errors, fetch):
+    """Wait for one endpoint started by the "fetch" stage, within the shared FETCH_DEADLINE."""
+    futures, deadline_at = fetch
+    try:
+        payload, error, _ = futures[name].result(timeout=max(0.0, deadline_at - time.monotonic()))
+    except TimeoutError:
+        futures[name].cancel()
+        payload, error = None, TimeoutError(f"EnviroTrust {name} did not respond within {FETCH_DEADLINE:.0f}s")
+    if error is None:
+        return payload
+    if name in REQUIRED_PAYLOADS:
+        raise PipelineError(f"Failed to fetch {name}: {error}")
+    logging.warning(f"Could not fetch {name}, the related chart will be empty: {error}")
+    errors[name] = error
+    return {}
+
+
+def _render_chart(name, parallel, fmt, payload):
+    from viz.charts import render_all_charts
+
+    charts, _ = render_all_charts({name: payload}, parallel=parallel, in_memory=True, fmt=fmt)
+    return charts[name]
+
+
+def report_graph(address, lat=None, lon=None, writer=None, parallel_charts=True, on_section=None, profile=None,
+                 out=None):
+    """
+    The whole report as a StageGraph, so stages overlap instead of running in phases:
+    every endpoint is its own "payload:<name>" stage, each "chart:<name>" starts as soon
+    as its payload arrives, and "narrative" as soon as the REQUIRED_PAYLOADS do, since
+    the prompt only needs chart names. "pdf" waits for everything.
+
+    Returns (graph, errors); `errors` fills with the optional payloads that failed while
+    the graph runs. With `on_section`, the narrative is streamed and on_section(key,
+    section) is called as each section finishes. `profile` is the PDF output profile;
+    with `out`, "pdf" writes the document there (see assemble_pdf) instead of returning it.
+    """
+    graph = StageGraph("report")
+    fmt = get_profile(profile)["chart_format"]
+    errors = {}
+
+    def start_fetches(coords):
+        return submit_all(*coords), time.monotonic() + FETCH_DEADLINE
+
+    def narrative(coords, *payloads):
+        data = dict(zip(REQUIRED_PAYLOADS, payloads))
+        if on_section is None:
+            return write_narrative(address, *coords, data, writer=writer)
+        sections = {}
+        for key, section in stream_narrative(address, *coords, data, writer=writer):
+            sections[key] = section
+            on_section(key, section)
+        return sections
+
+    def pdf(coords, risk_score, flood_zone, narrative, *charts):
+        data = {"risk_score": risk_score, "flood_zone": flood_zone}
+        return assemble_pdf(address, *coords, data, dict(zip(CHART_INPUTS, charts)), narrative, profile, out)
+
+    graph.add("locate", lambda: locate(address, lat, lon))
+    graph.add("fetch", start_fetches, ["locate"])
+    for name in ENDPOINTS:
+        graph.add(f"payload:{name}", functools.partial(_await_payload, name, errors), ["fetch"])
+    for name, payload in CHART_INPUTS.items():
+        graph.add(f"chart:{name}", functools.partial(_render_chart, name, parallel_charts, fmt), [f"payload:{payload}"])
+    graph.add("narrative", narrative, ["locate"] + [f"payload:{name}" for name in REQUIRED_PAYLOADS])
+    graph.add(
+        "pdf", pdf,
+        ["locate", "payload:risk_score", "payload:flood_zone", "narrative"] + [f"chart:{name}" for name in CHART_INPUTS],
+    )
+    return graph, errors
+
+
+@metrics.traced("pipeline.report")
+def generate_report(address, lat=None, lon=None, writer=None, parallel_charts=True, profile=None) -> dict:
+    """
+    Run the whole pipeline for one address, overlapping stages (see report_graph), and
+    return every intermediate result plus the stage timings and critical path.
+    """
+    graph, errors = report_graph(address, lat, lon, writer=writer, parallel_charts=parallel_charts, profile=profile)
+    results = graph.run()
+    graph.log_summary()
+    lat, lon = results["locate"]
+    return {
+        "lat": lat,
+        "lon": lon,
+        "data": {name: results[f"payload:{name}"] for name in ENDPOINTS},
+        "errors": errors,
+        "charts": {name: results[f"chart:{name}"] for name in CHART_INPUTS},
+        "narrative": results["narrative"],
+        "pdf": results["pdf"],
+        "timings": graph.timings,
+        "critical_path": graph.critical_path(),
+    }
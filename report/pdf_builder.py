@@ -1,8 +1,19 @@
 from fpdf import FPDF
+from fpdf.image_parsing import ImageCache, preload_image
+from fontTools import ttLib
+from PIL import Image
 from io import BytesIO
+from collections import OrderedDict
+import threading
+import hashlib
 import logging
+import copy
 import os
 
+from utils import metrics
+from utils.spatial import distance_m
+from report.profiles import PDF_PROFILE, get_profile
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
@@ -11,6 +22,22 @@ COLOR_BLUE = (0, 102, 204)
 COLOR_DARK_GREEN = (0, 100, 0)
 COLOR_GREY = (128, 128, 128)
 
+# Assets live next to this module, so building doesn't depend on the working directory.
+REPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_FILES = {
+    "": "DejaVuSans.ttf",
+    "B": "DejaVuSans-Bold.ttf",
+    "I": "DejaVuSans-Oblique.ttf",
+    "BI": "DejaVuSans-BoldOblique.ttf",
+}
+LOGO_PATH = os.path.join(REPORT_DIR, "ClimateLens Logo.png")
+LOGO_WIDTH = 40
+# Charts are placed this wide (mm) on the page.
+CHART_WIDTH = 180
+
+# Prepared chart images kept per builder, so identical charts are only re-encoded once.
+IMAGE_CACHE_ENTRIES = int(os.getenv("PDF_IMAGE_CACHE_ENTRIES", "64"))
+
 
 class PDF(FPDF):
     def header(self):
@@ -26,6 +53,65 @@ class PDF(FPDF):
         self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
 
 
+# (family, style, size) -> {word: width}. Report vocabularies are small, so this
+# stays compact; it is reset if a pathological input makes it grow too large.
+_word_widths = {}
+WORD_WIDTH_CACHE_LIMIT = 50000
+
+
+def _width_table(pdf):
+    key = (pdf.font_family, pdf.font_style, pdf.font_size_pt)
+    table = _word_widths.get(key)
+    if table is None or len(table) > WORD_WIDTH_CACHE_LIMIT:
+        table = _word_widths[key] = {}
+    return table
+
+
+def wrap_text(pdf, text, width):
+    """
+    Greedily wrap `text` into lines no wider than `width` in the current font, in a
+    single pass. Word widths are cached per font and size, and words longer than a
+    whole line are broken between characters.
+    """
+    widths = _width_table(pdf)
+
+    def measure(s):
+        w = widths.get(s)
+        if w is None:
+            w = widths[s] = pdf.get_string_width(s)
+        return w
+
+    space = measure(" ")
+    lines, current, current_w = [], [], 0.0
+    for word in text.split(" "):
+        if not word:
+            continue
+        word_w = measure(word)
+        if word_w > width:
+            if current:
+                lines.append(" ".join(current))
+            chunk, chunk_w = "", 0.0
+            for ch in word:
+                ch_w = measure(ch)
+                if chunk and chunk_w + ch_w > width:
+                    lines.append(chunk)
+                    chunk, chunk_w = "", 0.0
+                chunk += ch
+                chunk_w += ch_w
+            current, current_w = [chunk], chunk_w
+            continue
+        needed = current_w + space + word_w if current else word_w
+        if current and needed > width:
+            lines.append(" ".join(current))
+            current, current_w = [word], word_w
+        else:
+            current.append(word)
+            current_w = needed
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
 def safe_multi_cell(pdf, text, w=0, h=8, align='J'):
     """
     Safely wrap text to avoid 'Not enough horizontal space' errors.
@@ -35,129 +121,327 @@ def safe_multi_cell(pdf, text, w=0, h=8, align='J'):
         text = ""
     # Replace non-breaking hyphen/dash variants with normal dash
     text = text.replace("–", "-").replace("—", "-")
-    # Split very long words manually
-    words = text.split(" ")
-    lines = []
-    current_line = ""
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        if pdf.get_string_width(test_line) > pdf.w - pdf.l_margin - pdf.r_margin:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
+    # Wrap to the width multi_cell has for text, so FPDF never re-wraps a line
+    width = (w or pdf.w - pdf.r_margin - pdf.x) - 2 * pdf.c_margin
+    lines = wrap_text(pdf, text, width)
+    if not lines:
+        return
+    # One call per paragraph; hard line breaks keep every line unjustified as before
+    pdf.multi_cell(w, h, "\n".join(lines), align=align)
+    pdf.ln(0)
+
+
+def _image_bytes(chart) -> bytes:
+    """Charts may be image file paths, raw image bytes or file-like buffers."""
+    if isinstance(chart, (bytes, bytearray, memoryview)):
+        return bytes(chart)
+    if hasattr(chart, "read"):
+        chart.seek(0)
+        return chart.read()
+    with open(chart, "rb") as f:
+        return f.read()
+
+
+def _is_svg(data: bytes) -> bool:
+    head = data[:256].lstrip()
+    return head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in data[:4096])
+
+
+def reencode_image(data: bytes, profile: dict, width_mm: float = CHART_WIDTH) -> bytes:
+    """Downsample and re-encode a raster chart as the profile asks; returns the data unchanged otherwise."""
+    if not profile.get("image_dpi") and not profile.get("image_encoding"):
+        return data
+    with Image.open(BytesIO(data)) as img:
+        img.load()
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
         else:
-            current_line = test_line
-    if current_line:
-        lines.append(current_line)
-    # Write each line
-    for line in lines:
-        pdf.multi_cell(w, h, line, align=align)
-        pdf.ln(0)
-
-
-def build_pdf(lat, lon, address, risk_score, flood_zone, charts: dict, narrative: dict) -> BytesIO:
-    logging.info("Starting PDF build process...")
-    pdf = PDF()
-    pdf.set_auto_page_break(auto=True, margin=25)
-
-    # --- Register fonts (assumes DejaVu fonts in the same folder) ---
-    pdf.add_font("DejaVu", "", "DejaVuSans.ttf", uni=True)
-    pdf.add_font("DejaVu", "B", "DejaVuSans-Bold.ttf", uni=True)
-    pdf.add_font("DejaVu", "I", "DejaVuSans-Oblique.ttf", uni=True)
-    pdf.add_font("DejaVu", "BI", "DejaVuSans-BoldOblique.ttf", uni=True)
-
-    pdf.add_page()
-
-    # --- Title Page ---
-    pdf.set_font("DejaVu", "B", 36)
-    pdf.set_text_color(*COLOR_BLUE)
-    safe_multi_cell(pdf, "Climate & ESG Risk Report", h=12, align="C")
-    pdf.ln(10)
-
-    # Logo
-    logo_path = os.path.join(os.path.dirname(__file__), "ClimateLens Logo.png")
-    if os.path.exists(logo_path):
-        pdf.image(logo_path, x=85, w=40)
+            img = img.convert("RGB")
+    if profile.get("image_dpi"):
+        target_w = round(width_mm / 25.4 * profile["image_dpi"])
+        if target_w < img.width:
+            img = img.resize((target_w, max(1, round(img.height * target_w / img.width))), Image.LANCZOS)
+
+    out = BytesIO()
+    encoding = profile.get("image_encoding")
+    if encoding == "jpeg":
+        img.save(out, format="JPEG", quality=profile.get("jpeg_quality", 75), optimize=True)
+    elif encoding == "png8":
+        img = img.quantize(colors=profile.get("colors", 256), method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        img.save(out, format="PNG", optimize=True)
     else:
-        logging.warning("Logo not found, using placeholder box.")
-        pdf.set_fill_color(230, 230, 230)
-        pdf.rect(x=85, y=pdf.get_y(), w=40, h=40, style="F")
-    pdf.ln(50)
-
-    # Property address
-    pdf.set_font("DejaVu", "", 14)
-    pdf.set_text_color(0, 0, 0)
-    safe_multi_cell(pdf, f"Property at: {address}", h=10, align="C")
-    pdf.ln(20)
-
-    # --- Narrative Sections ---
-    section_order = ["executive_summary", "market_analysis", "climate_and_esg_risks", "final_verdict"]
-    chart_labels = {
-        "risk_bar": "Composite Climate Risk Scores",
-        "aq_gauges": "Air Quality Snapshot",
-        "wildfire_ts": "Wildfire Danger Trends",
-        "heatwind_scen": "Heat & Wind Climate Scenarios",
-        "recent_daily": "Recent Daily Weather",
-    }
-
-    for section_key in section_order:
-        section = narrative.get(section_key)
-        if not section:
-            continue
+        img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+class ReportBuilder:
+    """
+    Builds report PDFs. Fonts are parsed once when the builder is
+    created, so reuse one instance for many reports; each build only lays out the
+    address, narrative and charts.
+    """
+
+    def __init__(self, font_dir: str = REPORT_DIR, logo_path: str = LOGO_PATH):
+        self._font_paths = {style: os.path.join(font_dir, fname) for style, fname in FONT_FILES.items()}
+        self._font_bytes = {}
+        self._template = PDF()
+        for style, path in self._font_paths.items():
+            with open(path, "rb") as f:
+                self._font_bytes[style] = f.read()
+            self._template.add_font("DejaVu", style, path, uni=True)
+
+        # Charts prepared for embedding, keyed by content hash and profile (see _prepare_image).
+        self._images = OrderedDict()
+        self._images_lock = threading.Lock()
+
+        # The logo is prepared once per profile, on first use (see _prepare_image).
+        self._logo = None
+        if os.path.exists(logo_path):
+            with open(logo_path, "rb") as f:
+                self._logo = f.read()
+        else:
+            logging.warning("Logo not found, using placeholder box.")
 
+    def _install_fonts(self, pdf):
+        try:
+            for style in FONT_FILES:
+                font = copy.deepcopy(self._template.fonts["dejavu" + style])
+                # deepcopy shares the fontTools object, which fpdf subsets in place
+                # when writing; give every document its own lazily loaded one.
+                font.ttfont = ttLib.TTFont(BytesIO(self._font_bytes[style]), recalcTimestamp=False, lazy=True)
+                pdf.fonts[font.fontkey] = font
+        except (AttributeError, KeyError, TypeError) as e:
+            logging.warning(f"Could not reuse parsed fonts ({e}); loading them from disk.")
+            pdf.fonts = {}
+            for style, path in self._font_paths.items():
+                pdf.add_font("DejaVu", style, path, uni=True)
+
+    @staticmethod
+    def _place_image(pdf, name, info, **kwargs):
+        """Place a preloaded image; documents share the decoded stream instead of re-reading it."""
+        if name not in pdf.image_cache.images:
+            info = copy.copy(info)
+            info["i"] = len(pdf.image_cache.images) + 1
+            info["usages"] = 0
+            pdf.image_cache.images[name] = info
+        pdf.image(name, **kwargs)
+
+    def _place_logo(self, pdf, profile_name, profile):
+        x = (pdf.w - LOGO_WIDTH) / 2
+        if self._logo is None:
+            pdf.set_fill_color(230, 230, 230)
+            pdf.rect(x=x, y=pdf.get_y(), w=LOGO_WIDTH, h=LOGO_WIDTH, style="F")
+            return
+        name, info = self._prepare_image(self._logo, profile_name, profile, LOGO_WIDTH)
+        self._place_image(pdf, name, info, x=x, w=LOGO_WIDTH)
+
+    def _prepare_image(self, data, profile_name, profile, width_mm=CHART_WIDTH):
+        """
+        (name, preloaded info) of a raster image re-encoded for the profile. Identical
+        images get the same name, so a document embeds each image stream only once,
+        and the work is cached across documents.
+        """
+        name = f"img-{profile_name}-{width_mm:g}-{hashlib.sha256(data).hexdigest()[:32]}"
+        with self._images_lock:
+            info = self._images.get(name)
+            if info is not None:
+                self._images.move_to_end(name)
+                return name, info
+        _, _, info = preload_image(ImageCache(), reencode_image(data, profile, width_mm))
+        with self._images_lock:
+            self._images[name] = info
+            while len(self._images) > IMAGE_CACHE_ENTRIES:
+                self._images.popitem(last=False)
+        return name, info
+
+    def clear_image_cache(self):
+        with self._images_lock:
+            self._images.clear()
+
+    def _place_chart(self, pdf, chart, profile_name, profile, x, w):
+        data = _image_bytes(chart)
+        if _is_svg(data):
+            pdf.image(BytesIO(data), x=x, w=w)
+            return
+        name, info = self._prepare_image(data, profile_name, profile)
+        self._place_image(pdf, name, info, x=x, w=w)
+
+    def new_document(self) -> PDF:
+        pdf = PDF()
+        pdf.set_auto_page_break(auto=True, margin=25)
+        self._install_fonts(pdf)
+        return pdf
+
+    def layout(self, lat, lon, address, risk_score, flood_zone, charts: dict, narrative: dict,
+               profile: str = None, data_location=None) -> PDF:
+        """
+        Lay out a report. `profile` names an entry of PDF_PROFILES (default PDF_PROFILE).
+        `data_location` is the (lat, lon) the climate data was fetched for, when that
+        isn't the property's own location (a shared batch tile).
+        """
+        logging.info("Starting PDF build process...")
+        profile_name = profile or PDF_PROFILE
+        settings = get_profile(profile_name)
+        pdf = self.new_document()
         pdf.add_page()
-        # Section title
-        pdf.set_font("DejaVu", "B", 24)
+
+        # --- Title Page ---
+        pdf.set_font("DejaVu", "B", 36)
         pdf.set_text_color(*COLOR_BLUE)
-        safe_multi_cell(pdf, section.get("title", ""), h=10)
-        pdf.set_draw_color(*COLOR_BLUE)
-        pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y())
+        safe_multi_cell(pdf, "Climate & ESG Risk Report", h=12, align="C")
         pdf.ln(10)
 
-        for subsection in section.get("subsections", []):
-            # Subtitle
-            pdf.set_font("DejaVu", "B", 16)
-            pdf.set_text_color(*COLOR_DARK_GREEN)
-            safe_multi_cell(pdf, subsection.get("subtitle", ""), h=8)
-            pdf.ln(2)
-
-            # Paragraphs
-            pdf.set_font("DejaVu", "", 11)
-            pdf.set_text_color(0, 0, 0)
-            for p in subsection.get("paragraphs", []):
-                safe_multi_cell(pdf, p, h=6)
-                pdf.ln(1)
-
-            # Bullets
-            if subsection.get("bullets"):
-                for bullet in subsection.get("bullets", []):
-                    safe_multi_cell(pdf, f"  • {bullet}", h=6)
+        # Logo
+        self._place_logo(pdf, profile_name, settings)
+        pdf.ln(50)
+
+        # Property address
+        pdf.set_font("DejaVu", "", 14)
+        pdf.set_text_color(0, 0, 0)
+        safe_multi_cell(pdf, f"Property at: {address}", h=10, align="C")
+        if data_location is not None and tuple(data_location) != (lat, lon):
+            data_lat, data_lon = data_location
+            pdf.set_font("DejaVu", "", 10)
+            safe_multi_cell(
+                pdf,
+                f"Climate data retrieved for {data_lat:.5f}, {data_lon:.5f}, "
+                f"{distance_m((lat, lon), data_location):.0f} m from the property, and shared with nearby properties.",
+                h=6, align="C",
+            )
+        pdf.ln(20)
+
+        # --- Narrative Sections ---
+        section_order = ["executive_summary", "market_analysis", "climate_and_esg_risks", "final_verdict"]
+        chart_labels = {
+            "risk_bar": "Composite Climate Risk Scores",
+            "aq_gauges": "Air Quality Snapshot",
+            "wildfire_ts": "Wildfire Danger Trends",
+            "heatwind_scen": "Heat & Wind Climate Scenarios",
+            "recent_daily": "Recent Daily Weather",
+        }
+
+        for section_key in section_order:
+            section = narrative.get(section_key)
+            if not section:
+                continue
+
+            pdf.add_page()
+            # Section title
+            pdf.set_font("DejaVu", "B", 24)
+            pdf.set_text_color(*COLOR_BLUE)
+            safe_multi_cell(pdf, section.get("title", ""), h=10)
+            pdf.set_draw_color(*COLOR_BLUE)
+            pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y())
+            pdf.ln(10)
+
+            for subsection in section.get("subsections", []):
+                # Subtitle
+                pdf.set_font("DejaVu", "B", 16)
+                pdf.set_text_color(*COLOR_DARK_GREEN)
+                safe_multi_cell(pdf, subsection.get("subtitle", ""), h=8)
                 pdf.ln(2)
 
-            # Charts (avoid repeats)
-            if subsection.get("charts"):
-                used_charts = set()
-                for chart_ref in subsection.get("charts", []):
-                    if chart_ref in charts and chart_ref not in used_charts:
-                        used_charts.add(chart_ref)
-                        pdf.add_page()
-                        pdf.set_font("DejaVu", "B", 12)
-                        pdf.set_text_color(0, 0, 0)
-                        safe_multi_cell(pdf, chart_labels.get(chart_ref, "Chart"), h=8, align="C")
-                        page_width = pdf.w - pdf.l_margin - pdf.r_margin
-                        chart_width = min(180, page_width)
-                        x = (pdf.w - chart_width) / 2
-                        pdf.image(charts[chart_ref], x=x, w=chart_width)
-                        pdf.ln(5)
-
-    # --- Export PDF ---
-    logging.info("Encoding PDF to bytes...")
-    try:
-        pdf_bytes = pdf.output(dest="S")
-        buf = BytesIO(pdf_bytes)
-        buf.seek(0)
+                # Paragraphs
+                pdf.set_font("DejaVu", "", 11)
+                pdf.set_text_color(0, 0, 0)
+                for p in subsection.get("paragraphs", []):
+                    safe_multi_cell(pdf, p, h=6)
+                    pdf.ln(1)
+
+                # Bullets
+                if subsection.get("bullets"):
+                    for bullet in subsection.get("bullets", []):
+                        safe_multi_cell(pdf, f"  • {bullet}", h=6)
+                    pdf.ln(2)
+
+                # Charts (avoid repeats)
+                if subsection.get("charts"):
+                    used_charts = set()
+                    for chart_ref in subsection.get("charts", []):
+                        if chart_ref in charts and chart_ref not in used_charts:
+                            used_charts.add(chart_ref)
+                            pdf.add_page()
+                            pdf.set_font("DejaVu", "B", 12)
+                            pdf.set_text_color(0, 0, 0)
+                            safe_multi_cell(pdf, chart_labels.get(chart_ref, "Chart"), h=8, align="C")
+                            page_width = pdf.w - pdf.l_margin - pdf.r_margin
+                            chart_width = min(CHART_WIDTH, page_width)
+                            x = (pdf.w - chart_width) / 2
+                            self._place_chart(pdf, charts[chart_ref], profile_name, settings, x, chart_width)
+                            pdf.ln(5)
+
+        return pdf
+
+    @staticmethod
+    def _encode(pdf) -> bytearray:
+        """The finished document; fpdf's own buffer, not a copy."""
+        logging.info("Encoding PDF to bytes...")
+        try:
+            data = pdf.output()
+        except Exception as e:
+            logging.error(f"Failed to build PDF: {e}")
+            raise
         logging.info("PDF built successfully.")
-        return buf
-    except Exception as e:
-        logging.error(f"Failed to build PDF: {e}")
-        raise
+        return data
+
+    def build(self, lat, lon, address, risk_score, flood_zone, charts: dict, narrative: dict,
+              profile: str = None, data_location=None) -> BytesIO:
+        """Lay out a report and return it in memory."""
+        pdf = self.layout(lat, lon, address, risk_score, flood_zone, charts, narrative, profile, data_location)
+        return BytesIO(self._encode(pdf))
+
+    def write(self, out, lat, lon, address, risk_score, flood_zone, charts: dict, narrative: dict,
+              profile: str = None, data_location=None) -> int:
+        """Lay out a report and write it to `out` (see write_pdf_bytes); returns its size in bytes."""
+        pdf = self.layout(lat, lon, address, risk_score, flood_zone, charts, narrative, profile, data_location)
+        data = self._encode(pdf)
+        write_pdf_bytes(data, out)
+        return len(data)
+
+
+def write_pdf_bytes(data, out):
+    """
+    Write a finished PDF to `out`: a path, replaced atomically through a ".part" file,
+    or a binary file-like object such as an open file or a ZIP entry.
+    """
+    if isinstance(out, (str, os.PathLike)):
+        tmp_path = f"{os.fspath(out)}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, out)
+    else:
+        out.write(data)
+
+
+_default_builder = None
+_default_builder_lock = threading.Lock()
+
+
+def get_report_builder() -> ReportBuilder:
+    """The shared ReportBuilder used by build_pdf, created on first use."""
+    global _default_builder
+    with _default_builder_lock:
+        if _default_builder is None:
+            _default_builder = ReportBuilder()
+    return _default_builder
+
+
+def build_pdf(lat, lon, address, risk_score, flood_zone, charts: dict, narrative: dict, profile: str = None,
+              out=None, data_location=None):
+    """
+    Build a report with the shared builder. Returns a BytesIO, or with `out` (a path or
+    binary file-like object) writes the document there without copying it and returns `out`.
+    `data_location` is where the climate data was fetched, if not at (lat, lon).
+    """
+    with metrics.span("pdf_build", profile=profile or PDF_PROFILE) as span:
+        builder = get_report_builder()
+        if out is None:
+            buf = builder.build(lat, lon, address, risk_score, flood_zone, charts, narrative, profile, data_location)
+            span.set(bytes=buf.getbuffer().nbytes)
+            return buf
+        span.set(bytes=builder.write(
+            out, lat, lon, address, risk_score, flood_zone, charts, narrative, profile, data_location
+        ))
+        return out
@@ -0,0 +1,94 @@
+"""
+Streaming ZIP archive of finished reports.
+
+PortfolioArchive appends each report to one ZIP file as soon as it is done: PDFs
+already on disk are copied into their entry in chunks, and entry() hands out a
+writable entry the PDF builder can write into directly. Nothing but the ZIP index
+is kept in memory, however many reports the archive holds.
+
+The index (central directory) is only written by close(). An archive left without
+one by an interrupted run can't be appended to, so it is started over and the
+caller re-adds what it has on disk (see batch.py).
+"""
+import os
+import time
+import shutil
+import logging
+import zipfile
+import threading
+from contextlib import contextmanager
+
+# PDF streams are already Flate-compressed, so deflating them again saves little.
+ARCHIVE_COMPRESSION = os.getenv("PORTFOLIO_COMPRESSION", "stored")
+COMPRESSION_TYPES = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+COPY_CHUNK = 1024 * 1024
+
+
+class PortfolioArchive:
+    """
+    A ZIP archive reports are appended to, from any thread. An existing archive is
+    appended to; `names` holds the entries it already has.
+    """
+
+    def __init__(self, path, compression: str = ARCHIVE_COMPRESSION):
+        if compression not in COMPRESSION_TYPES:
+            raise ValueError(f"Unknown archive compression {compression!r}; choose from {', '.join(COMPRESSION_TYPES)}")
+        self.path = path
+        self._compression = COMPRESSION_TYPES[compression]
+        self._lock = threading.Lock()
+        mode = "w"
+        if os.path.exists(path):
+            if zipfile.is_zipfile(path):
+                mode = "a"
+            else:
+                logging.warning(f"{path} is not a complete ZIP archive (interrupted run?); starting it over")
+        self._zip = zipfile.ZipFile(path, mode, compression=self._compression, allowZip64=True)
+        self.names = set(self._zip.namelist())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def _info(self, name, size=None):
+        if name in self.names:
+            raise ValueError(f"{self.path} already has an entry {name!r}")
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._compression
+        if size is not None:
+            info.file_size = size
+        return info
+
+    def add_file(self, path, name=None):
+        """Copy a finished file into the archive, `COPY_CHUNK` bytes at a time."""
+        name = name or os.path.basename(path)
+        with self._lock, open(path, "rb") as src:
+            info = self._info(name, os.fstat(src.fileno()).st_size)
+            with self._zip.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            self.names.add(name)
+
+    @contextmanager
+    def entry(self, name):
+        """
+        A new entry open for writing, e.g. as build_pdf's `out`. Only one entry can be
+        open at a time, so other writers wait until it is closed. ZIP entries can't be
+        removed, so one whose writer raised keeps what was written.
+        """
+        with self._lock:
+            try:
+                with self._zip.open(self._info(name), "w", force_zip64=True) as dst:
+                    yield dst
+            finally:
+                self.names.add(name)
+
+    def close(self):
+        with self._lock:
+            self._zip.close()
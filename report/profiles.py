@@ -0,0 +1,28 @@
+"""
+PDF output profiles, kept apart from pdf_builder so choosing one doesn't import fpdf.
+"""
+import os
+
+# chart_format: "png", or "svg" to embed charts as vector drawings (sharp at any zoom).
+# image_dpi: raster images (charts and the logo) are downsampled to this resolution at
+#   their printed width; None keeps them as they are, so one cached chart serves every profile.
+# image_encoding: None embeds the image as it is; "png8" flattens it onto white and
+#   quantizes it to `colors` palette entries (lossless-looking for flat charts);
+#   "jpeg" re-encodes it at `jpeg_quality`.
+# Content streams and fonts are Flate-compressed and subset in every profile.
+PDF_PROFILES = {
+    "archival": {"chart_format": "png", "image_dpi": None, "image_encoding": None},
+    "light": {"chart_format": "png", "image_dpi": 110, "image_encoding": "png8", "colors": 64},
+    "draft": {"chart_format": "png", "image_dpi": 96, "image_encoding": "jpeg", "jpeg_quality": 70},
+    # Charts stay sharp at any zoom; only the logo is raster.
+    "vector": {"chart_format": "svg", "image_dpi": 150, "image_encoding": None},
+}
+PDF_PROFILE = os.getenv("PDF_PROFILE", "archival")
+
+
+def get_profile(name: str = None) -> dict:
+    """Settings of a PDF output profile; defaults to PDF_PROFILE."""
+    name = name or PDF_PROFILE
+    if name not in PDF_PROFILES:
+        raise ValueError(f"Unknown PDF profile {name!r}; choose from {', '.join(PDF_PROFILES)}")
+    return PDF_PROFILES[name]
@@ -1,11 +1,44 @@
 import logging
 import json
 import os
-from openai import OpenAI
+import re
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services import normalize
+from utils.cache import TieredCache
+from utils import metrics
 
 logging.basicConfig(level=logging.INFO)
 
 DEFAULT_MODEL = "gpt-5"
+WEB_SEARCH_TOOLS = [{"type": "web_search_preview"}]
+SECTION_RETRIES = 2
+# "openai", or "offline" for the deterministic local stand-in (OfflineBackend).
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+# Ask the API to constrain output to REPORT_SCHEMA instead of relying on the prompt alone.
+STRUCTURED_OUTPUT = os.getenv("AI_STRUCTURED_OUTPUT", "0") == "1"
+
+# -------------------------
+# Narrative cache settings
+# -------------------------
+# Model output is cached under a fingerprint of (model, PROMPT_VERSION, tools, prompt).
+# Bump PROMPT_VERSION whenever the prompts or the validation of their output change.
+PROMPT_VERSION = 1
+NARRATIVE_CACHE_ENABLED = os.getenv("NARRATIVE_CACHE", "1") != "0"
+# Empty string keeps the cache in memory only.
+NARRATIVE_CACHE_PATH = os.getenv(
+    "NARRATIVE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "climatelens", "narrative.sqlite"),
+)
+# Market analysis relies on web search, so narratives go stale; a week by default.
+NARRATIVE_CACHE_TTL = float(os.getenv("NARRATIVE_CACHE_TTL", str(7 * 24 * 3600)))
+# Bounds of both the in-process tier and the SQLite file.
+NARRATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NARRATIVE_CACHE_MAX_ENTRIES", "512"))
+NARRATIVE_CACHE_MAX_BYTES = int(os.getenv("NARRATIVE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
 
 SYSTEM_PROMPT = """
 You are a world-class climate-risk and ESG consultant producing reports for high-value residential properties.
@@ -74,6 +107,60 @@ RULES:
 """
 
 AVAILABLE_CHARTS = ["risk_bar", "aq_gauges", "wildfire_ts", "heatwind_scen", "recent_daily"]
+REQUIRED_SECTIONS = ["executive_summary", "market_analysis", "climate_and_esg_risks", "final_verdict"]
+
+# Per-section generation: each section gets its own small prompt, and only
+# market_analysis (property prices, rental trends) needs web search.
+SECTION_PROMPT_HEADER = """
+You are a world-class climate-risk and ESG consultant producing reports for high-value residential properties.
+You should use plain language and NOT any links or reference URLs.
+"""
+
+SECTION_SPECS = {
+    "executive_summary": {
+        "title": "Executive Summary",
+        "charts": [],
+        "tools": [],
+        "guidance": "Summarize the property's overall climate and ESG risk profile.",
+    },
+    "market_analysis": {
+        "title": "Market Analysis",
+        "charts": ["wildfire_ts", "heatwind_scen"],
+        "tools": WEB_SEARCH_TOOLS,
+        "guidance": (
+            "Include:\n"
+            "- Average property prices in the area\n"
+            "- Typical rental/valuation trends\n"
+            "- Liquidity, insurance, and resilience premiums"
+        ),
+    },
+    "climate_and_esg_risks": {
+        "title": "Climate and ESG Risks",
+        "charts": ["risk_bar", "aq_gauges", "recent_daily"],
+        "tools": [],
+        "guidance": "Explain the air quality, flood, wildfire, heat and wind risks in the key data.",
+    },
+    "final_verdict": {
+        "title": "Final Verdict",
+        "charts": [],
+        "tools": [],
+        "guidance": "Give a clear overall recommendation for a prospective buyer or investor.",
+    },
+}
+
+def _property_text(lat, lon, address, risk_score, flood_zone, wildfire_now):
+    scores = normalize.risk_scores(risk_score)
+    return f"""Generate a report for the property at:
+Address: {address}
+Latitude: {lat}
+Longitude: {lon}
+
+Key Data:
+- Air Quality Risk: {scores["air_quality"]}
+- Flood Risk: {scores["flood_risk"]}
+- Wildfire Risk: {scores["wildfire_risk"]}
+- Flood Zone: {normalize.flood_zone(flood_zone)}
+- Wildfire Risk (1km radius): {normalize.fire_risk_class(wildfire_now)}"""
 
 def _build_prompt(lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs):
     chart_info = []
@@ -86,79 +173,668 @@ def _build_prompt(lat, lon, address, risk_score, flood_zone, wildfire_now, **kwa
     return f"""
 {SYSTEM_PROMPT}
 
-Generate a report for the property at:
-Address: {address}
-Latitude: {lat}
-Longitude: {lon}
-
-Key Data:
-- Air Quality Risk: {risk_score.get("scores", {}).get("air_quality")}
-- Flood Risk: {risk_score.get("scores", {}).get("flood_risk")}
-- Wildfire Risk: {risk_score.get("scores", {}).get("wildfire_risk")}
-- Flood Zone: {flood_zone.get("flood_zone")}
-- Wildfire Risk (1km radius): {wildfire_now.get("properties", {}).get("fire_risk_class")}
+{_property_text(lat, lon, address, risk_score, flood_zone, wildfire_now)}
 
 {chart_text}
 
 **CRITICAL:** Output must be a single valid JSON object strictly following the schema above, with no extra text, no URLs, and no deviations.
 """
 
+def _build_section_prompt(sec, lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs):
+    spec = SECTION_SPECS[sec]
+    charts = [c for c in spec["charts"] if kwargs.get(c)]
+    schema = json.dumps({sec: {
+        "title": spec["title"],
+        "subsections": [{
+            "subtitle": "Subsection Title",
+            "paragraphs": ["Paragraph text..."],
+            "bullets": ["Bullet point..."],
+            "charts": charts,
+        }],
+    }}, indent=2)
+
+    return f"""
+{SECTION_PROMPT_HEADER}
+Write ONLY the "{spec["title"]}" section of the report.
+STRICT SCHEMA (MUST FOLLOW EXACTLY):
+{schema}
+
+{spec["guidance"]}
+
+RULES:
+1. **MUST FOLLOW SCHEMA EXACTLY**. NO extra keys, fields, or URLs.
+2. Paragraphs: 2–3 short paragraphs per subsection.
+3. Bullets: optional, 3–5 bullets if present.
+4. Charts: choose from {json.dumps(charts)} only, no repeats, or leave the list empty.
+5. Output ONLY JSON. DO NOT add any explanation or text outside the JSON.
+
+{_property_text(lat, lon, address, risk_score, flood_zone, wildfire_now)}
+"""
+
+# -------------------------
+# Output schema and validation
+# -------------------------
+def _string_list():
+    return {"type": "array", "items": {"type": "string"}}
+
+SECTION_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["title", "subsections"],
+    "properties": {
+        "title": {"type": "string"},
+        "subsections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["subtitle", "paragraphs", "bullets", "charts"],
+                "properties": {
+                    "subtitle": {"type": "string"},
+                    "paragraphs": _string_list(),
+                    "bullets": _string_list(),
+                    "charts": {"type": "array", "items": {"type": "string", "enum": AVAILABLE_CHARTS}},
+                },
+            },
+        },
+    },
+}
+
+def _object_schema(sections):
+    return {
+        "type": "object",
+        "additionalProperties": False,
+        "required": list(sections),
+        "properties": {sec: SECTION_SCHEMA for sec in sections},
+    }
+
+REPORT_SCHEMA = _object_schema(REQUIRED_SECTIONS)
+
+def _text_format(name, schema):
+    """The Responses API `text` parameter for strict JSON-schema output."""
+    return {"format": {"type": "json_schema", "name": name, "schema": schema, "strict": True}}
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+# A key (a string right after "{" or ",") with no value yet, at the end of a truncated reply.
+_DANGLING_KEY_RE = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+
+def _drop_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+def _repair_json(text):
+    """
+    Best-effort fix-up of nearly valid model output: strips code fences and text
+    around the object, drops trailing commas, and closes strings, arrays and
+    objects left open by a truncated reply.
+
+    Returns (repaired_text, truncated, cut_key): whether the reply was cut off, and
+    the top-level key whose value was still being written when it was (or None).
+    """
+    text = _FENCE_RE.sub("", text)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("no JSON object in output")
+    out, closers = [], []
+    in_string = escaped = False
+    string_start = last_key = None
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                if len(closers) == 1:
+                    # Top-level values are objects, so a string closed here is a key.
+                    last_key = json.loads("".join(out[string_start:]), strict=False)
+            continue
+        if ch in "}]":
+            _drop_trailing_comma(out)
+            if not closers:
+                break
+            out.append(closers.pop())
+            if not closers:
+                break  # ignore anything after the top-level object
+            continue
+        if ch == '"':
+            in_string = True
+            string_start = len(out)
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        out.append(ch)
+
+    truncated = in_string or bool(closers)
+    # Cut inside a top-level value: that section ends in whatever was written so far.
+    cut_key = last_key if len(closers) > 1 else None
+    if in_string:
+        out.append('"')
+    tail = "".join(out)
+    if closers:
+        if closers[-1] == "}":
+            tail = _DANGLING_KEY_RE.sub(r"\1", tail)
+        out = list(tail)
+        _drop_trailing_comma(out)
+        tail = "".join(out) + "".join(reversed(closers))
+    return tail, truncated, cut_key
+
+def _parse_output(raw_output, model="Model"):
+    """
+    json.loads, falling back to a local repair of nearly valid output. Returns
+    (parsed, repair): repair is None for valid JSON, otherwise {"truncated", "cut_key"}
+    as found by _repair_json. `model` names the source in log messages. Raises ValueError.
+    """
+    try:
+        return json.loads(raw_output), None
+    except json.JSONDecodeError:
+        text, truncated, cut_key = _repair_json(raw_output)
+        parsed = json.loads(text, strict=False)
+        logging.info(f"{model} output was not valid JSON; recovered it with a local repair.")
+        return parsed, {"truncated": truncated, "cut_key": cut_key}
+
+def _as_strings(value):
+    if isinstance(value, str):
+        return [value]
+    return [v for v in value if isinstance(v, str)] if isinstance(value, list) else []
+
+def _check_section(sec, section):
+    """
+    Validate a section in place, filling in what can be inferred locally: the
+    default title, missing bullets/charts, and a bare string where a list belongs.
+    Raises ValueError when the section is unusable.
+    """
+    if not isinstance(section, dict) or not isinstance(section.get("subsections"), list):
+        raise ValueError(f"Section '{sec}' missing 'title' or 'subsections'")
+    if not isinstance(section.get("title"), str):
+        if sec not in SECTION_SPECS:
+            raise ValueError(f"Section '{sec}' missing 'title' or 'subsections'")
+        section["title"] = SECTION_SPECS[sec]["title"]
+    if not section["subsections"]:
+        raise ValueError(f"Section '{sec}' has no subsections")
+    for sub in section["subsections"]:
+        if not isinstance(sub, dict) or not isinstance(sub.get("subtitle"), str):
+            raise ValueError(f"A subsection in '{sec}' is missing 'subtitle' or 'paragraphs'")
+        sub["paragraphs"] = _as_strings(sub.get("paragraphs"))
+        if not sub["paragraphs"]:
+            raise ValueError(f"A subsection in '{sec}' is missing 'subtitle' or 'paragraphs'")
+        sub["bullets"] = _as_strings(sub.get("bullets"))
+        sub["charts"] = _as_strings(sub.get("charts"))
+
+
+def _dedupe_charts(section, used_charts):
+    """Drop unknown charts and charts already used by an earlier subsection; updates used_charts."""
+    for sub in section["subsections"]:
+        if "charts" in sub:
+            # Keep only allowed charts
+            sub["charts"] = [c for c in sub["charts"] if c in AVAILABLE_CHARTS]
+            # Keep charts not already used in other subsections
+            new_charts = []
+            for c in sub["charts"]:
+                if c not in used_charts:
+                    new_charts.append(c)
+                    used_charts.add(c)
+            sub["charts"] = new_charts
+
+
+# -------------------------
+# Narrative cache
+# -------------------------
+_narrative_cache = None
+_savings = {"tokens_saved": 0, "seconds_saved": 0.0}
+_savings_lock = threading.Lock()
+
+def get_narrative_cache() -> TieredCache:
+    global _narrative_cache
+    if _narrative_cache is None:
+        _narrative_cache = TieredCache(
+            path=NARRATIVE_CACHE_PATH,
+            max_entries=NARRATIVE_CACHE_MAX_ENTRIES,
+            max_bytes=NARRATIVE_CACHE_MAX_BYTES,
+            disk_max_entries=NARRATIVE_CACHE_MAX_ENTRIES,
+            disk_max_bytes=NARRATIVE_CACHE_MAX_BYTES,
+        )
+    return _narrative_cache
+
+def prompt_fingerprint(prompt, tools=WEB_SEARCH_TOOLS, model=DEFAULT_MODEL, text_format=None) -> str:
+    blob = json.dumps([model, PROMPT_VERSION, tools, text_format, prompt], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def narrative_cache_stats() -> dict:
+    """Hit/miss counters of the narrative cache, plus the tokens and API seconds hits saved."""
+    with _savings_lock:
+        savings = {"tokens_saved": _savings["tokens_saved"], "seconds_saved": round(_savings["seconds_saved"], 3)}
+    return {**get_narrative_cache().stats(), **savings}
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) or 0
+
+class SectionStreamParser:
+    """
+    Incremental parser for the narrative JSON object. Feed it text as it streams in;
+    each call returns the (key, value) pairs of top-level members completed so far.
+    Anything before the opening brace (such as a ```json fence) is ignored. A value
+    that can't be parsed, even after local repair, comes back as None.
+    """
+
+    def __init__(self, model="Model"):
+        self.model = model  # named in log messages
+        self.repaired = False  # whether any value needed a local repair
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def _finish_value(self, end):
+        text = "".join(self._buf[self._value_start:end]).strip()
+        key, self._key, self._value_start = self._key, None, None
+        try:
+            value, repair = _parse_output(text, self.model)
+            self.repaired = self.repaired or repair is not None
+            return key, value
+        except ValueError as e:
+            logging.warning(f"{self.model} returned invalid JSON for section '{key}': {e}")
+            return key, None
+
+    def feed(self, chunk: str) -> list:
+        completed = []
+        for ch in chunk:
+            i = len(self._buf)
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._value_start is None:
+                        self._key = json.loads("".join(self._buf[self._key_start:i + 1]))
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 1 and self._value_start is not None:
+                    completed.append(self._finish_value(i))
+                self._depth -= 1
+            elif ch == ":" and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = i + 1
+            elif ch == "," and self._depth == 1 and self._value_start is not None:
+                completed.append(self._finish_value(i))
+        return completed
+
+
+# -------------------------
+# LLM backends
+# -------------------------
+# A backend has a `model` name and two methods:
+#   complete(prompt, tools, text_format) -> (output_text, total_tokens)
+#   stream(prompt, tools, text_format, usage) -> iterator of text deltas; total tokens go into `usage`
+class OpenAIBackend:
+    def __init__(self, api_key: str = None, model: str = DEFAULT_MODEL):
+        # Imported here: the SDK takes most of a second to import, and offline runs never need it.
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
+        self.model = model
+
+    def complete(self, prompt, tools=WEB_SEARCH_TOOLS, text_format=None):
+        extra = {"text": text_format} if text_format else {}
+        response = self.client.responses.create(
+            model=self.model,
+            tools=tools,
+            input=prompt,
+            **extra
+        )
+        return response.output_text, _usage_tokens(response)
+
+    def stream(self, prompt, tools=WEB_SEARCH_TOOLS, text_format=None, usage=None):
+        extra = {"text": text_format} if text_format else {}
+        stream = self.client.responses.create(
+            model=self.model,
+            tools=tools,
+            input=prompt,
+            stream=True,
+            **extra
+        )
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type == "response.completed" and usage is not None:
+                usage["tokens"] = _usage_tokens(event.response)
+            elif event.type in ("response.failed", "error"):
+                raise RuntimeError(f"{self.model} streaming response failed: {event}")
+
+
+_ADDRESS_RE = re.compile(r"^Address: (.*)$", re.MULTILINE)
+
+class OfflineBackend:
+    """
+    Deterministic local stand-in for load tests and offline runs. Returns schema-valid
+    narratives derived from a hash of the prompt, so the same prompt always gets the
+    same reply, after `latency` seconds (plus up to `jitter`). `failure_rate` makes
+    that share of calls raise, and `malformed_rate` truncates that share of replies
+    to exercise the JSON repair and per-section retry paths. `seed` fixes which
+    calls fail.
+    """
+
+    model = "offline"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 malformed_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            return self._rng.random(), self._rng.random(), self._rng.uniform(0, self.jitter)
+
+    def _reply(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        match = _ADDRESS_RE.search(prompt)
+        address = match.group(1) if match else "the property"
+        # Per-section prompts name their section; anything else asks for the whole report.
+        sections = [sec for sec, spec in SECTION_SPECS.items() if f'Write ONLY the "{spec["title"]}"' in prompt]
+        per_section = bool(sections)
+        sections = sections or REQUIRED_SECTIONS
+        reply = {}
+        for i, sec in enumerate(sections):
+            spec = SECTION_SPECS[sec]
+            # Only charts the prompt offers: "'name': include" lines, or a section prompt's chart list.
+            charts = [c for c in spec["charts"] if f"'{c}': include" in prompt or (per_section and f'"{c}"' in prompt)]
+            n_subsections = 1 + digest[i] % 2
+            reply[sec] = {
+                "title": spec["title"],
+                "subsections": [{
+                    "subtitle": f"{spec['title']} {j + 1}",
+                    "paragraphs": [
+                        f"Offline narrative paragraph {k + 1} of {spec['title'].lower()} for {address}."
+                        for k in range(2 + digest[i + j] % 2)
+                    ],
+                    "bullets": [f"Offline bullet {k + 1}." for k in range(3 + digest[i + j + 1] % 3)],
+                    "charts": charts[j::n_subsections],
+                } for j in range(n_subsections)],
+            }
+        return json.dumps(reply)
+
+    def _respond(self, prompt):
+        failure, malformed, jitter = self._draw()
+        delay = self.latency + jitter
+        if failure < self.failure_rate:
+            time.sleep(delay / 2)
+            raise RuntimeError("Injected offline backend failure")
+        text = self._reply(prompt)
+        if malformed < self.malformed_rate:
+            text = text[: len(text) * 3 // 4]
+        return text, delay, (len(prompt) + len(text)) // 4
+
+    def complete(self, prompt, tools=WEB_SEARCH_TOOLS, text_format=None):
+        text, delay, tokens = self._respond(prompt)
+        time.sleep(delay)
+        return text, tokens
+
+    def stream(self, prompt, tools=WEB_SEARCH_TOOLS, text_format=None, usage=None):
+        text, delay, tokens = self._respond(prompt)
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield chunk
+        if usage is not None:
+            usage["tokens"] = tokens
+
+
+def make_backend(name: str = None, openai_api_key: str = None):
+    """Build the backend named by `name` (default: the LLM_BACKEND env var)."""
+    name = name or LLM_BACKEND
+    if name == "openai":
+        return OpenAIBackend(api_key=openai_api_key)
+    if name == "offline":
+        return OfflineBackend(
+            latency=float(os.getenv("OFFLINE_LLM_LATENCY", "0")),
+            jitter=float(os.getenv("OFFLINE_LLM_JITTER", "0")),
+            failure_rate=float(os.getenv("OFFLINE_LLM_FAILURE_RATE", "0")),
+            malformed_rate=float(os.getenv("OFFLINE_LLM_MALFORMED_RATE", "0")),
+        )
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
 class AIWriter:
-    def __init__(self, openai_api_key: str = None):
-        self.client = OpenAI(api_key=openai_api_key or os.environ.get("OPENAI_API_KEY"))
+    def __init__(self, openai_api_key: str = None, per_section: bool = False,
+                 use_cache: bool = NARRATIVE_CACHE_ENABLED, refresh: bool = False,
+                 structured_output: bool = STRUCTURED_OUTPUT, backend=None):
+        """
+        `backend` is an OpenAIBackend, an OfflineBackend or anything with the same
+        methods; by default make_backend() picks one from LLM_BACKEND.
+
+        With `per_section`, generate_sections asks for each section in its own
+        concurrent request instead of one request for the whole report. With
+        `structured_output`, requests carry a strict JSON schema (REPORT_SCHEMA).
+
+        Validated model output is kept in the narrative cache. `use_cache=False`
+        bypasses it entirely; `refresh=True` always calls the model but stores the
+        new output, replacing whatever was cached for the same prompt.
+        """
+        self.backend = backend or make_backend(openai_api_key=openai_api_key)
+        self.per_section = per_section
+        self.use_cache = use_cache
+        self.refresh = refresh
+        self.structured_output = structured_output
+
+    def _format(self, name, sections):
+        return _text_format(name, _object_schema(sections)) if self.structured_output else None
 
-    def _call_openai(self, prompt: str) -> str:
-        logging.info("Calling GPT-5 API...")
+    def _call_model(self, prompt: str, tools=WEB_SEARCH_TOOLS, text_format=None):
+        """Return (output_text, total_tokens) for one model call."""
+        logging.info(f"Calling {self.backend.model} API...")
         try:
-            response = self.client.responses.create(
-                model=DEFAULT_MODEL,
-                tools=[{"type": "web_search_preview"}],
-                input=prompt
-            )
-            output_text = response.output_text
-            logging.info("GPT-5 response received.")
-            return output_text
+            output_text, tokens = self.backend.complete(prompt, tools, text_format)
+            logging.info(f"{self.backend.model} response received.")
+            return output_text, tokens
         except Exception as e:
-            logging.error(f"OpenAI API call failed: {e}")
+            logging.error(f"{self.backend.model} API call failed: {e}")
             raise
 
+    def _cached_output(self, key, refresh=False):
+        """Cached model output for a prompt fingerprint, or None on a miss, bypass or refresh."""
+        if not self.use_cache or self.refresh or refresh:
+            return None
+        entry = get_narrative_cache().get(key)
+        if entry is None:
+            return None
+        with _savings_lock:
+            _savings["tokens_saved"] += entry["tokens"]
+            _savings["seconds_saved"] += entry["seconds"]
+        logging.info(f"{self.backend.model} output served from the narrative cache.")
+        return entry["text"]
+
+    def _store_output(self, key, text, tokens, seconds):
+        """Cache model output once it has been validated, so bad output is never replayed."""
+        if self.use_cache:
+            get_narrative_cache().set(
+                key, {"text": text, "tokens": tokens, "seconds": round(seconds, 3)}, ttl=NARRATIVE_CACHE_TTL
+            )
+
+    def _complete(self, prompt, tools=WEB_SEARCH_TOOLS, refresh=False, text_format=None):
+        """
+        Return (output_text, store) where `store()` caches the output; callers invoke
+        it after validation. Cache hits get a no-op `store`.
+        """
+        with metrics.span("llm", model=self.backend.model) as span:
+            key = prompt_fingerprint(prompt, tools, self.backend.model, text_format)
+            cached = self._cached_output(key, refresh)
+            if cached is not None:
+                span.set(cache="hit", bytes=len(cached))
+                return cached, lambda: None
+            start = time.perf_counter()
+            text, tokens = self._call_model(prompt, tools, text_format)
+            seconds = time.perf_counter() - start
+            span.set(cache="miss", bytes=len(text), tokens=tokens)
+        return text, lambda: self._store_output(key, text, tokens, seconds)
+
     def generate_sections(self, lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs) -> dict:
-      prompt = _build_prompt(lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs)
-      raw_output = self._call_openai(prompt)
+      if self.per_section:
+          return self.generate_sections_parallel(lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs)
+
+      args = (lat, lon, address, risk_score, flood_zone, wildfire_now)
+      prompt = _build_prompt(*args, **kwargs)
+      raw_output, store = self._complete(prompt, text_format=self._format("climate_report", REQUIRED_SECTIONS))
 
+      repair = None
       try:
-          parsed_json = json.loads(raw_output)
-          logging.info("GPT-5 JSON parsed successfully.")
-      except json.JSONDecodeError as e:
+          parsed_json, repair = _parse_output(raw_output, self.backend.model)
+          logging.info(f"{self.backend.model} JSON parsed successfully.")
+      except ValueError as e:
           logging.error(f"Failed to parse JSON: {e}\nRaw output:\n{raw_output}")
-          raise ValueError("GPT-5 returned invalid JSON") from e
+          parsed_json = {}
+      if not isinstance(parsed_json, dict):
+          parsed_json = {}
+      # The section the reply was cut off in would pass validation with half a paragraph.
+      if repair and repair["cut_key"] in parsed_json:
+          logging.warning(f"{self.backend.model} output was cut off in section '{repair['cut_key']}'")
+          del parsed_json[repair["cut_key"]]
 
-      # Validate top-level sections and subsections
-      required_sections = ["executive_summary", "market_analysis", "climate_and_esg_risks", "final_verdict"]
-      for sec in required_sections:
-          if sec not in parsed_json:
-              raise ValueError(f"Missing required top-level section: {sec}")
-          if "title" not in parsed_json[sec] or "subsections" not in parsed_json[sec]:
-              raise ValueError(f"Section '{sec}' missing 'title' or 'subsections'")
+      # Validate top-level sections and subsections; only the ones that fail are regenerated.
+      failed = []
+      for sec in REQUIRED_SECTIONS:
+          try:
+              if sec not in parsed_json:
+                  raise ValueError(f"Missing required top-level section: {sec}")
+              _check_section(sec, parsed_json[sec])
+          except ValueError as e:
+              logging.warning(f"{e}; regenerating this section on its own")
+              failed.append(sec)
+      if failed:
+          parsed_json.update(self._generate_concurrently(failed, args, kwargs))
+      elif repair is None:
+          # Repaired output is used once but never cached.
+          store()
 
       # Deduplicate charts globally across all subsections
       used_charts = set()
-      for sec in required_sections:
-          for sub in parsed_json[sec]["subsections"]:
-              if "subtitle" not in sub or "paragraphs" not in sub:
-                  raise ValueError(f"A subsection in '{sec}' is missing 'subtitle' or 'paragraphs'")
-              
-              if "charts" in sub:
-                  # Keep only allowed charts
-                  sub["charts"] = [c for c in sub["charts"] if c in AVAILABLE_CHARTS]
-                  # Keep charts not already used in other subsections
-                  new_charts = []
-                  for c in sub["charts"]:
-                      if c not in used_charts:
-                          new_charts.append(c)
-                          used_charts.add(c)
-                  sub["charts"] = new_charts
-
-      logging.info("GPT-5 JSON validated successfully with unique charts across subsections.")
+      for sec in REQUIRED_SECTIONS:
+          _dedupe_charts(parsed_json[sec], used_charts)
+
+      logging.info(f"{self.backend.model} JSON validated successfully with unique charts across subsections.")
       return parsed_json
 
+    def _generate_section(self, sec, *args, **kwargs) -> dict:
+        """Generate and validate one section, retrying only this section on failure."""
+        prompt = _build_section_prompt(sec, *args, **kwargs)
+        text_format = self._format(sec, [sec])
+        for attempt in range(SECTION_RETRIES + 1):
+            try:
+                # Retries always go to the model.
+                raw_output, store = self._complete(
+                    prompt, SECTION_SPECS[sec]["tools"], refresh=attempt > 0, text_format=text_format
+                )
+                parsed, repair = _parse_output(raw_output, self.backend.model)
+                if repair and repair["truncated"]:
+                    raise ValueError("output was cut off")
+                section = parsed.get(sec, parsed) if isinstance(parsed, dict) else parsed
+                _check_section(sec, section)
+                if repair is None:
+                    store()
+                return section
+            except Exception as e:
+                if attempt == SECTION_RETRIES:
+                    raise ValueError(f"{self.backend.model} failed to produce section '{sec}': {e}") from e
+                logging.warning(f"Section '{sec}' failed ({e}); retrying ({attempt + 1}/{SECTION_RETRIES})")
+
+    def _generate_concurrently(self, sections, args, kwargs) -> dict:
+        with ThreadPoolExecutor(max_workers=len(sections)) as pool:
+            futures = {sec: pool.submit(self._generate_section, sec, *args, **kwargs) for sec in sections}
+            return {sec: future.result() for sec, future in futures.items()}
+
+    def generate_sections_parallel(self, lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs) -> dict:
+        """
+        Generate every section as an independent concurrent request with its own
+        prompt and tools. Wall-clock time is that of the slowest section, and a
+        failed section is retried without regenerating the others.
+        """
+        args = (lat, lon, address, risk_score, flood_zone, wildfire_now)
+        parsed_json = self._generate_concurrently(REQUIRED_SECTIONS, args, kwargs)
+
+        # Deduplicate charts globally across all subsections
+        used_charts = set()
+        for sec in REQUIRED_SECTIONS:
+            _dedupe_charts(parsed_json[sec], used_charts)
+
+        logging.info(f"{self.backend.model} sections generated and validated with unique charts across subsections.")
+        return parsed_json
+
+    def _stream_model(self, prompt: str, usage: dict = None, text_format=None):
+        """Yield output text deltas as the model produces them; total tokens go into `usage`."""
+        logging.info(f"Calling {self.backend.model} API (streaming)...")
+        try:
+            with metrics.span("llm_stream", model=self.backend.model) as span:
+                yield from self.backend.stream(prompt, WEB_SEARCH_TOOLS, text_format, usage)
+                span.set(tokens=(usage or {}).get("tokens", 0))
+            logging.info(f"{self.backend.model} stream finished.")
+        except Exception as e:
+            logging.error(f"{self.backend.model} API call failed: {e}")
+            raise
+
+    def stream_sections(self, lat, lon, address, risk_score, flood_zone, wildfire_now, **kwargs):
+        """
+        Like generate_sections, but yields (section_key, section) pairs as soon as each
+        top-level section has been fully streamed, so callers can show it right away.
+        Sections are validated and chart-deduplicated in arrival order. Sections that
+        never arrive or fail validation are regenerated on their own once the stream
+        ends, and yielded last.
+        """
+        args = (lat, lon, address, risk_score, flood_zone, wildfire_now)
+        prompt = _build_prompt(*args, **kwargs)
+        text_format = self._format("climate_report", REQUIRED_SECTIONS)
+        key = prompt_fingerprint(prompt, WEB_SEARCH_TOOLS, self.backend.model, text_format)
+        cached = self._cached_output(key)
+        usage = {}
+        # A cached reply is replayed through the parser as a single chunk.
+        deltas = [cached] if cached is not None else self._stream_model(prompt, usage, text_format)
+        parser = SectionStreamParser(self.backend.model)
+        used_charts = set()
+        seen = set()
+        chunks = []
+        start = time.perf_counter()
+        for delta in deltas:
+            chunks.append(delta)
+            for sec, section in parser.feed(delta):
+                if sec not in REQUIRED_SECTIONS:
+                    logging.warning(f"Ignoring unexpected section in {self.backend.model} output: {sec}")
+                    continue
+                try:
+                    _check_section(sec, section)
+                except ValueError as e:
+                    logging.warning(f"{e}; regenerating this section on its own")
+                    continue
+                _dedupe_charts(section, used_charts)
+                seen.add(sec)
+                logging.info(f"{self.backend.model} section '{sec}' received.")
+                yield sec, section
+
+        failed = [sec for sec in REQUIRED_SECTIONS if sec not in seen]
+        if failed:
+            for sec, section in self._generate_concurrently(failed, args, kwargs).items():
+                _dedupe_charts(section, used_charts)
+                yield sec, section
+        elif cached is None and not parser.repaired:
+            text = "".join(chunks)
+            try:
+                json.loads(text)
+            except ValueError:
+                return  # e.g. cut off after the last section; fine to use, not to replay
+            self._store_output(key, text, usage.get("tokens", 0), time.perf_counter() - start)
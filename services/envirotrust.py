@@ -1,20 +1,325 @@
 import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
 
-BASE = "https://api.envirotrust.eu"
+from utils.cache import TieredCache
+from utils import metrics, jsonstream
+from services.normalize import RECENT_DAYS
+
+# Point ENVIROTRUST_BASE_URL at a local stand-in server for tests and benchmarks.
+BASE = os.getenv("ENVIROTRUST_BASE_URL", "https://api.envirotrust.eu")
+
+# -------------------------
+# HTTP client settings
+# -------------------------
+REQUEST_TIMEOUT = 60
+POOL_SIZE = int(os.getenv("ENVIROTRUST_POOL_SIZE", "16"))
+MAX_RETRIES = int(os.getenv("ENVIROTRUST_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("ENVIROTRUST_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("ENVIROTRUST_BACKOFF_MAX", "20"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BREAKER_THRESHOLD = int(os.getenv("ENVIROTRUST_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("ENVIROTRUST_BREAKER_RESET", "30"))
+
+# -------------------------
+# Response cache settings
+# -------------------------
+CACHE_ENABLED = os.getenv("ENVIROTRUST_CACHE", "1") != "0"
+# Coordinates are snapped to this grid (degrees) for cache keys; 0.001 is ~110 m.
+CACHE_GRID = float(os.getenv("ENVIROTRUST_CACHE_GRID", "0.001"))
+# Empty string keeps the cache in memory only.
+CACHE_PATH = os.getenv(
+    "ENVIROTRUST_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "climatelens", "envirotrust.sqlite"),
+)
+CACHE_MAX_ENTRIES = int(os.getenv("ENVIROTRUST_CACHE_MAX_ENTRIES", "2048"))
+
+HOUR = 3600
+DAY = 24 * HOUR
+# Per-endpoint TTLs in seconds. Endpoints missing here are never cached.
+CACHE_TTLS = {
+    "/api/climate_risk/risk_score": DAY,
+    "/api/airquality/timeseries-daily": HOUR,
+    "/api/airquality/timeseries-monthly": DAY,
+    "/api/flood/zone-current": 30 * DAY,
+    "/api/wildfire/risk-current": 6 * HOUR,
+    "/api/wildfire/timeseries": 365 * DAY,
+    "/api/heat-wind/daily": 6 * HOUR,
+    "/api/heat-wind/timeseries": 365 * DAY,
+}
+
+
+# -------------------------
+# Timeseries streaming
+# -------------------------
+# With ENVIROTRUST_STREAM=1, timeseries responses larger than STREAM_MIN_BYTES (or of
+# unknown length) are parsed incrementally from the response body instead of with
+# r.json(). That takes longer than r.json(), but holds less in memory: about half as
+# much for a whole series and, since the DAILY_WINDOW tail is applied while parsing,
+# next to nothing for a long daily series. Off by default; see benchmarks/bench_ingest.py.
+# The values are the payload keys holding the records.
+SERIES_KEYS = {
+    "/api/airquality/timeseries-daily": "air_quality_timeseries",
+    "/api/airquality/timeseries-monthly": "air_quality_timeseries",
+    "/api/wildfire/timeseries": "wildfire_risk_timeseries_data",
+    "/api/heat-wind/daily": "heat_wind_daily_data",
+    "/api/heat-wind/timeseries": "heat_wind_timeseries_data",
+}
+STREAM_ENABLED = os.getenv("ENVIROTRUST_STREAM", "0") != "0"
+STREAM_MIN_BYTES = int(os.getenv("ENVIROTRUST_STREAM_MIN_BYTES", str(1024 * 1024)))
+STREAM_CHUNK = 64 * 1024
+# Trailing days kept from the daily series (the report only shows the last RECENT_DAYS); 0 keeps all.
+DAILY_WINDOW = int(os.getenv("ENVIROTRUST_DAILY_WINDOW", str(RECENT_DAYS)))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without contacting the API while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive upstream failures and rejects calls for
+    `reset_timeout` seconds. After that a single trial call is let through: success
+    closes the breaker again, failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logging.warning("EnviroTrust circuit breaker opened after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breaker = CircuitBreaker()
+_cache = None
+_session = None
+_session_pid = None
+_session_lock = threading.RLock()  # get_session holds it while calling configure_session
+
+
+def configure_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """(Re)create the shared keep-alive session with a connection pool of `pool_size`."""
+    global _session, _session_pid
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with _session_lock:
+        old, _session, _session_pid = _session, session, os.getpid()
+    if old is not None:
+        old.close()
+    return session
+
+
+def get_session() -> requests.Session:
+    # Pooled sockets must not be shared with forked worker processes.
+    session = _session
+    if session is not None and _session_pid == os.getpid():
+        return session
+    with _session_lock:
+        # Threads starting cold together must not replace (and close) each other's session.
+        if _session is not None and _session_pid == os.getpid():
+            return _session
+        return configure_session()
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter keeps concurrent workers from retrying in lockstep.
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache(path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the EnviroTrust response cache."""
+    return get_cache().stats()
+
+
+def _quantize(value: float, grid: float = None) -> float:
+    grid = grid or CACHE_GRID
+    return round(round(float(value) / grid) * grid, 6)
+
+
+def _cache_key(path, params, tail=None):
+    if not CACHE_ENABLED or not CACHE_TTLS.get(path) or not params:
+        return None
+    if "latitude" not in params or "longitude" not in params:
+        return None
+    extra = sorted((k, v) for k, v in params.items() if k not in ("latitude", "longitude"))
+    key = f"{path}|{_quantize(params['latitude'])}|{_quantize(params['longitude'])}|{extra}"
+    return f"{key}|tail={tail}" if tail else key
+
+
+def _trim(payload, records_key, tail):
+    """Keep the last `tail` records of a timeseries payload, given as {records_key: [...]} or the bare list."""
+    if isinstance(payload, list):
+        return payload[-tail:]
+    if isinstance(payload, dict) and isinstance(payload.get(records_key), (list, dict)):
+        records = payload[records_key]
+        payload[records_key] = records[-tail:] if isinstance(records, list) else dict(list(records.items())[-tail:])
+    return payload
+
+
+def _read_series(r, path, tail=None, span=None):
+    """Parse a streamed timeseries response record by record, keeping only the last `tail` records."""
+    received = 0
+
+    def chunks():
+        nonlocal received
+        for chunk in r.iter_content(STREAM_CHUNK):
+            received += len(chunk)
+            yield chunk
+
+    tails = {SERIES_KEYS[path]: tail, None: tail} if tail else None
+    try:
+        with r:
+            return jsonstream.load(chunks(), tails)
+    except ValueError:
+        raise RuntimeError(f"EnviroTrust API returned non-JSON response for {path}")
+    finally:
+        if span is not None:
+            span.set(bytes=received)
+
+
+def _get(path, params=None, stream=False, tail=None):
+    """
+    GET an EnviroTrust endpoint and return its JSON payload, or the open response with
+    `stream`. `tail` keeps only the last `tail` records of a timeseries endpoint.
+    """
+    with metrics.span("envirotrust", endpoint=path) as span:
+        key = None if stream else _cache_key(path, params, tail)
+        if key is not None:
+            cached = get_cache().get(key)
+            span.set(cache="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+
+        if stream:
+            return _request(path, params, True, span)
+        if STREAM_ENABLED and path in SERIES_KEYS:
+            r = _request(path, params, True, span)
+            length = r.headers.get("Content-Length")
+            if length is None or not length.isdigit() or int(length) >= STREAM_MIN_BYTES:
+                data = _read_series(r, path, tail, span)
+            else:
+                with r:
+                    data = _json(r, span)
+        else:
+            data = _request(path, params, False, span)
+        if tail and path in SERIES_KEYS:
+            # A no-op after _read_series, which already kept only the tail.
+            data = _trim(data, SERIES_KEYS[path], tail)
+        if key is not None:
+            get_cache().set(key, data, ttl=CACHE_TTLS[path])
+        return data
+
+
+def _request(path, params=None, stream=False, span=None):
+    if not _breaker.allow():
+        raise CircuitOpenError(f"EnviroTrust API unavailable, not calling {path} (circuit open)")
 
-def _get(path, params=None, stream=False):
-    import os
-    import requests
     headers = {"x-api-key": os.getenv("ENVIROTRUST_API_KEY")}
     url = f"{BASE}{path}"
-    r = requests.get(url, headers=headers, params=params, stream=stream, timeout=60)
-
-    if r.status_code != 200:
-        raise RuntimeError(f"EnviroTrust API error {r.status_code}: {r.text}")
+    attempt = 0
+    # Every call must tell the breaker how it went, or a half-open trial never ends.
+    settled = False
+    try:
+        while True:
+            try:
+                r = get_session().get(url, headers=headers, params=params, stream=stream, timeout=REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= MAX_RETRIES:
+                    settled = True
+                    _breaker.record_failure()
+                    raise
+                delay = _backoff(attempt)
+            else:
+                if r.status_code == 200:
+                    break
+                if r.status_code not in RETRY_STATUSES:
+                    # The upstream answered, so it is not down; the request itself is bad.
+                    settled = True
+                    _breaker.record_success()
+                    raise RuntimeError(f"EnviroTrust API error {r.status_code}: {r.text}")
+                delay = _retry_after(r)
+                if delay is None:
+                    delay = _backoff(attempt)
+                if attempt >= MAX_RETRIES or delay > BACKOFF_MAX:
+                    settled = True
+                    _breaker.record_failure()
+                    raise RuntimeError(f"EnviroTrust API error {r.status_code}: {r.text}")
+                r.close()
+            attempt += 1
+            logging.info("Retrying EnviroTrust %s in %.2fs (attempt %d)", path, delay, attempt + 1)
+            time.sleep(delay)
 
+        settled = True
+        _breaker.record_success()
+    finally:
+        if not settled:
+            # Anything not handled above, e.g. ChunkedEncodingError or ContentDecodingError.
+            _breaker.record_failure()
+    if span is not None:
+        span.set(attempts=attempt + 1)
     if stream:
         return r
+    return _json(r, span)
+
+
+def _json(r, span=None):
+    if span is not None:
+        span.set(bytes=len(r.content))
 
     # Ensure JSON response
     try:
@@ -29,8 +334,8 @@ def get_risk_score(lat: float, lon: float):
     return _get("/api/climate_risk/risk_score", {"latitude": lat, "longitude": lon})
 
 # 2) Air quality time-series (daily & monthly)
-def get_air_quality_daily(lat: float, lon: float):
-    return _get("/api/airquality/timeseries-daily", {"latitude": lat, "longitude": lon})
+def get_air_quality_daily(lat: float, lon: float, days: int = DAILY_WINDOW):
+    return _get("/api/airquality/timeseries-daily", {"latitude": lat, "longitude": lon}, tail=days)
 
 def get_air_quality_monthly(lat: float, lon: float):
     return _get("/api/airquality/timeseries-monthly", {"latitude": lat, "longitude": lon})
@@ -47,8 +352,81 @@ def get_wildfire_timeseries(lat: float, lon: float):
     return _get("/api/wildfire/timeseries", {"latitude": lat, "longitude": lon})
 
 # 5) Heat/Wind: daily & climate scenarios time series
-def get_heat_wind_daily(lat: float, lon: float):
-    return _get("/api/heat-wind/daily", {"latitude": lat, "longitude": lon})
+def get_heat_wind_daily(lat: float, lon: float, days: int = DAILY_WINDOW):
+    return _get("/api/heat-wind/daily", {"latitude": lat, "longitude": lon}, tail=days)
 
 def get_heat_wind_timeseries(lat: float, lon: float):
     return _get("/api/heat-wind/timeseries", {"latitude": lat, "longitude": lon})
+
+# -------------------------
+# Concurrent fan-out
+# -------------------------
+# Result keys match the variable names app.py has always used for each payload.
+ENDPOINTS = {
+    "risk_score": get_risk_score,
+    "aq_daily": get_air_quality_daily,
+    "aq_monthly": get_air_quality_monthly,
+    "flood_zone": get_flood_zone_current,
+    "wildfire_now": get_wildfire_current,
+    "wildfire_ts": get_wildfire_timeseries,
+    "heatwind_daily": get_heat_wind_daily,
+    "heatwind_ts": get_heat_wind_timeseries,
+}
+
+FETCH_DEADLINE = float(os.getenv("ENVIROTRUST_FETCH_DEADLINE", "75"))
+
+
+def _timed_call(fn, lat, lon):
+    start = time.perf_counter()
+    try:
+        return fn(lat, lon), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def submit_all(lat: float, lon: float, endpoints=None, max_workers=None) -> dict:
+    """
+    Start fetching EnviroTrust payloads for (lat, lon) concurrently without waiting.
+    Returns name -> Future of (payload, error, seconds).
+    """
+    endpoints = endpoints or list(ENDPOINTS)
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(endpoints), thread_name_prefix="envirotrust")
+    futures = {name: executor.submit(_timed_call, ENDPOINTS[name], lat, lon) for name in endpoints}
+    # Don't block on stragglers; their sockets time out on their own.
+    executor.shutdown(wait=False)
+    return futures
+
+
+def fetch_all(lat: float, lon: float, deadline: float = FETCH_DEADLINE, endpoints=None, max_workers=None) -> dict:
+    """
+    Fetch all EnviroTrust payloads for (lat, lon) concurrently.
+
+    Returns {"data": {...}, "errors": {...}, "timings": {...}} keyed by the names in
+    ENDPOINTS. Failed endpoints, and endpoints still running when `deadline` seconds
+    have passed, are reported in "errors" instead of "data".
+    """
+    result = {"data": {}, "errors": {}, "timings": {}}
+    start = time.perf_counter()
+    futures = {future: name for name, future in submit_all(lat, lon, endpoints, max_workers).items()}
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+
+    for future in done:
+        name = futures[future]
+        payload, error, elapsed = future.result()
+        result["timings"][name] = elapsed
+        if error is None:
+            result["data"][name] = payload
+        else:
+            result["errors"][name] = error
+    for future in not_done:
+        name = futures[future]
+        result["timings"][name] = time.perf_counter() - start
+        result["errors"][name] = TimeoutError(f"EnviroTrust {name} did not respond within {deadline:.0f}s")
+
+    logging.info(
+        "EnviroTrust fan-out finished in %.2fs (%d ok, %d failed)",
+        time.perf_counter() - start, len(result["data"]), len(result["errors"]),
+    )
+    return result
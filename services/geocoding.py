@@ -0,0 +1,120 @@
+import os
+import re
+import logging
+import unicodedata
+import threading
+import requests
+
+from utils.cache import TieredCache
+from utils.ratelimit import TokenBucket
+from utils import metrics
+
+# Point NOMINATIM_URL at a local stand-in server for tests and benchmarks.
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+USER_AGENT = "ClimateLensApp/1.0 (https://yourwebsite.com/contact)"  # User should replace with actual contact info
+REQUEST_TIMEOUT = 30
+
+# Nominatim's usage policy allows at most one request per second per application.
+RATE_PER_SECOND = float(os.getenv("NOMINATIM_RATE", "1"))
+# Empty string keeps the cache and the rate limiter local to this process.
+CACHE_PATH = os.getenv(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "climatelens", "geocode.sqlite"),
+)
+FOUND_TTL = 180 * 24 * 3600
+NOT_FOUND_TTL = 24 * 3600
+
+_cache = None
+_limiter = None
+_session = None
+_init_lock = threading.Lock()
+
+
+def _shared():
+    global _cache, _limiter, _session
+    with _init_lock:
+        if _cache is None:
+            _cache = TieredCache(path=CACHE_PATH, max_entries=4096)
+            _limiter = TokenBucket(RATE_PER_SECOND, capacity=1, path=CACHE_PATH, name="nominatim")
+            _session = requests.Session()
+    return _cache, _limiter, _session
+
+
+def normalize_address(address: str) -> str:
+    """Canonical cache key for an address: case, Unicode forms, spacing and stray punctuation folded."""
+    text = unicodedata.normalize("NFKC", address or "").casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ,.;")
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the geocoding cache."""
+    return _shared()[0].stats()
+
+
+def _query_nominatim(address):
+    _, limiter, session = _shared()
+    params = {
+        "q": address,
+        "format": "json",
+        "limit": 1
+    }
+    headers = {
+        "User-Agent": USER_AGENT
+    }
+    limiter.acquire()
+    response = session.get(NOMINATIM_URL, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status() # Raise an exception for HTTP errors
+    data = response.json()
+    if data:
+        return float(data[0]["lat"]), float(data[0]["lon"])
+    return None, None
+
+
+@metrics.traced("geocode")
+def geocode_address(address):
+    """Resolve an address to (lat, lon) with Nominatim, or (None, None) if it can't be found."""
+    key = normalize_address(address)
+    if not key:
+        return None, None
+    cache = _shared()[0]
+    cached = cache.get(key)
+    if cached is not None:
+        return cached["lat"], cached["lon"]
+
+    try:
+        lat, lon = _query_nominatim(address)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Geocoding API error: {e}")
+        return None, None
+    except (ValueError, KeyError, IndexError):
+        logging.error("Could not parse geocoding response.")
+        return None, None
+
+    # Transient errors above are not cached, but "no such address" is, briefly.
+    cache.set(key, {"lat": lat, "lon": lon}, ttl=FOUND_TTL if lat is not None else NOT_FOUND_TTL)
+    return lat, lon
+
+
+def geocode_many(addresses) -> dict:
+    """
+    Geocode many addresses, querying Nominatim once per distinct normalized address.
+
+    Returns {address: (lat, lon)} for every input; unresolved ones map to (None, None).
+    Requests are serialized through the shared rate limiter, so running this from
+    several workers at once stays within Nominatim's policy.
+    """
+    by_key = {}
+    for address in addresses:
+        by_key.setdefault(normalize_address(address), []).append(address)
+
+    results = {}
+    for i, originals in enumerate(by_key.values(), start=1):
+        coords = geocode_address(originals[0])
+        for address in originals:
+            results[address] = coords
+        if i % 50 == 0:
+            logging.info(f"Geocoded {i}/{len(by_key)} distinct addresses")
+    logging.info(f"Geocoded {len(results)} addresses ({len(by_key)} distinct)")
+    return results
@@ -0,0 +1,169 @@
+"""
+Normalization of raw EnviroTrust payloads.
+
+Each payload is turned once into compact typed structures (float32 value columns,
+datetime64 dates) that both the charts and the AI prompt builder consume, so
+schema quirks and API drift are handled here and nowhere else.
+
+pandas is imported by the timeseries functions only, so the prompt builder's scalar
+lookups don't pay for it. Series longer than MAX_POINTS rows are downsampled with
+LTTB, which keeps the peaks and troughs a chart needs.
+"""
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+VALUE_DTYPE = np.float32
+
+RISK_SCORE_KEYS = ("air_quality", "flood_risk", "wildfire_risk")
+# Location and year columns repeated inside every wildfire row; the row key is the year label.
+WILDFIRE_DROP = ("latitude", "longitude", "year")
+# One of each: heatwaves, consecutive dry days and extreme wind speed.
+HEAT_WIND_SCENARIOS = ("heatwaves_rcp45", "consecutive_dry_days_rcp45", "extreme_wind_speed_days_rcp45")
+# 'year' duplicates 'date'; '2m temperature(K)' is left out of the daily chart.
+DAILY_DROP = ("year", "2m temperature(K)")
+RECENT_DAYS = 30
+# Rows a timeseries chart is drawn from at most; 0 draws every row.
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "120"))
+
+
+def _as_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _records(payload, key):
+    """Timeseries endpoints return either {key: [...]} or the bare list."""
+    if isinstance(payload, dict):
+        payload = payload.get(key, [])
+    return payload if isinstance(payload, list) else []
+
+
+def _numeric(df, columns):
+    import pandas as pd
+
+    if columns:
+        df[columns] = df[columns].apply(pd.to_numeric, errors="coerce").astype(VALUE_DTYPE)
+    return df
+
+
+# -------------------------
+# Downsampling
+# -------------------------
+def lttb_indices(y, threshold, x=None) -> np.ndarray:
+    """
+    Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps from a
+    series: the first and last point plus, from each bucket in between, the point
+    spanning the largest triangle with its neighbours. `x` defaults to even spacing.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # Missing values count as 0 when choosing points; the kept rows still carry NaN.
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df, columns, max_points: int = MAX_POINTS):
+    """
+    At most `max_points` rows of `df`: the union of the rows LTTB keeps for each of
+    `columns`, in order. Shorter frames are returned as they are.
+    """
+    if not max_points or len(df) <= max_points or not columns:
+        return df
+    per_column = max(3, max_points // len(columns))
+    keep = np.unique(np.concatenate([lttb_indices(df[c].to_numpy(), per_column) for c in columns]))
+    return df.iloc[keep]
+
+
+# -------------------------
+# Scalar payloads
+# -------------------------
+def risk_scores(payload) -> dict:
+    """{"air_quality", "flood_risk", "wildfire_risk"} -> float, or None when not reported."""
+    scores = payload.get("scores", {}) if isinstance(payload, dict) else {}
+    scores = scores if isinstance(scores, dict) else {}
+    return {key: _as_float(scores.get(key)) for key in RISK_SCORE_KEYS}
+
+
+def flood_zone(payload):
+    return payload.get("flood_zone") if isinstance(payload, dict) else None
+
+
+def fire_risk_class(payload):
+    props = payload.get("properties", {}) if isinstance(payload, dict) else {}
+    return props.get("fire_risk_class") if isinstance(props, dict) else None
+
+
+def air_quality_latest(payload) -> dict:
+    """Most recent {"aqi", "pm2_5"} reading; 0.0 where missing."""
+    rows = _records(payload, "air_quality_timeseries")
+    last = rows[-1] if rows and isinstance(rows[-1], dict) else {}
+    return {
+        "aqi": _as_float(last.get("air_quality_index")) or 0.0,
+        "pm2_5": _as_float(last.get("pm2_5")) or 0.0,
+    }
+
+
+# -------------------------
+# Timeseries payloads
+# -------------------------
+def wildfire_timeseries(payload, max_points: int = MAX_POINTS) -> "pd.DataFrame":
+    """Days per danger level, indexed by the payload's year label, one float32 column per level."""
+    import pandas as pd
+
+    wf_ts = payload.get("wildfire_risk_timeseries_data", {}) if isinstance(payload, dict) else {}
+    if not isinstance(wf_ts, dict) or not wf_ts:
+        return pd.DataFrame()
+    df = pd.DataFrame.from_dict(wf_ts, orient="index")
+    df = df.drop(columns=[c for c in WILDFIRE_DROP if c in df.columns])
+    df = _numeric(df, list(df.columns))
+    return downsample(df, list(df.columns), max_points)
+
+
+def heat_wind_scenarios(payload, scenarios=HEAT_WIND_SCENARIOS, max_points: int = MAX_POINTS) -> "pd.DataFrame":
+    """A "year" column plus one float32 column per requested scenario present in the payload."""
+    import pandas as pd
+
+    rows = _records(payload, "heat_wind_timeseries_data")
+    if not rows or not isinstance(rows[0], dict):
+        return pd.DataFrame()
+    # Only the wanted columns are materialized, in the order the API sends them.
+    present = [key for key in rows[0] if key in scenarios]
+    df = pd.DataFrame.from_records(rows, columns=["year", *present])
+    df["year"] = pd.to_numeric(df["year"], errors="coerce")
+    return downsample(_numeric(df, present), present, max_points)
+
+
+def recent_daily(payload, days: int = RECENT_DAYS, max_points: int = MAX_POINTS) -> "pd.DataFrame":
+    """The trailing `days` daily readings (all of them for 0): a datetime64 "date" column plus float32 measurements."""
+    import pandas as pd
+
+    rows = _records(payload, "heat_wind_daily_data")
+    if days:
+        rows = rows[-days:]
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame.from_records(rows)
+    df = df.drop(columns=[c for c in DAILY_DROP if c in df.columns])
+    df["date"] = pd.to_datetime(df["date"])
+    measurements = [c for c in df.columns if c != "date"]
+    return downsample(_numeric(df, measurements), measurements, max_points)
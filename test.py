@@ -8,6 +8,7 @@ load_dotenv()
 
 # Mock data for testing
 mock_data = {
+    "address": "Fürstenrieder Str. 279, 81377 Munich, Germany",
     "lat": 48.097,
     "lon": 11.506,
     "risk_score": {
@@ -29,7 +30,7 @@ mock_data = {
 def test_ai_writer():
     print("🧪 Running AIWriter test...")
     try:
-        # This requires a live call to OpenAI, ensure API key is set
+        # This makes a live call to OpenAI, ensure API key is set (or run with LLM_BACKEND=offline)
         ai_writer = AIWriter(openai_api_key=os.environ.get("OPENAI_API_KEY"))
         narrative_json = ai_writer.generate_sections(**mock_data)
 
@@ -0,0 +1,76 @@
+import json
+
+from services.ai_writer import _repair_json, _parse_output, SectionStreamParser
+
+DOC = {
+    "executive_summary": {"title": "Executive Summary", "subsections": [
+        {"subtitle": 'Quotes " and {braces}', "paragraphs": ["a, b: c", "back\\slash", "café"]},
+    ]},
+    "final_verdict": {"title": "Final Verdict", "subsections": [{"subtitle": "[x]", "paragraphs": []}]},
+}
+
+
+def test_repair_truncated_inside_section():
+    text = json.dumps(DOC)
+    cut = text[:text.index("back") + 2]  # inside the executive summary's second paragraph
+    repaired, truncated, cut_key = _repair_json(cut)
+    parsed = json.loads(repaired)
+    assert truncated and cut_key == "executive_summary"
+    assert list(parsed) == ["executive_summary"]
+    assert parsed["executive_summary"]["subsections"][0]["paragraphs"] == ["a, b: c", "ba"]
+
+
+def test_repair_truncated_between_sections():
+    text = json.dumps(DOC)
+    for cut in (text[:text.index('"final_verdict"')], text[:text.index('"final_verdict"') + 5],
+                text[:text.index('"final_verdict"') + len('"final_verdict": ')]):
+        repaired, truncated, cut_key = _repair_json(cut)
+        # Only the section that was complete is left, and nothing was cut inside it.
+        assert truncated and cut_key is None, cut[-20:]
+        assert json.loads(repaired) == {"executive_summary": DOC["executive_summary"]}
+
+
+def test_repair_fenced_and_trailing_commas():
+    fenced = "```json\n" + json.dumps(DOC, indent=2) + "\n```\nHope this helps!"
+    assert _repair_json(fenced)[1:] == (False, None)
+    assert _parse_output(fenced) == (DOC, {"truncated": False, "cut_key": None})
+
+    text = '{"a": [1, 2,], "b": {"c": "d,",},}'
+    repaired, truncated, cut_key = _repair_json(text)
+    assert json.loads(repaired) == {"a": [1, 2], "b": {"c": "d,"}}
+    assert not truncated and cut_key is None
+
+
+def test_parse_output():
+    assert _parse_output(json.dumps(DOC)) == (DOC, None)
+    for bad in ("no json here", ""):
+        try:
+            _parse_output(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad!r} parsed")
+
+
+def test_stream_parser_chunks():
+    text = "```json\n" + json.dumps(DOC, indent=1) + "\n```"
+    for size in range(1, 30):
+        parser = SectionStreamParser()
+        pairs = []
+        for i in range(0, len(text), size):
+            pairs.extend(parser.feed(text[i:i + size]))
+        assert pairs == list(DOC.items()), f"chunk size {size}"
+        assert not parser.repaired
+
+
+def test_stream_parser_repaired_section():
+    parser = SectionStreamParser()
+    pairs = parser.feed('{"executive_summary": {"title": "A", "subsections": [],}, "final_verdict": ')
+    assert pairs == [("executive_summary", {"title": "A", "subsections": []})]
+    assert parser.repaired
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
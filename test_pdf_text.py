@@ -0,0 +1,45 @@
+from report.pdf_builder import get_report_builder, wrap_text
+
+TEXT = (
+    "Munich's Maxvorstadt combines century-old façades with new infill, and demand has outpaced supply "
+    "for a decade. "
+) * 6 + "A-very-long-identifier-" * 12 + " end."
+
+
+def _document(size):
+    pdf = get_report_builder().new_document()
+    pdf.add_page()
+    pdf.set_font("DejaVu", "", size)
+    return pdf
+
+
+def test_wrap_text_is_never_rewrapped():
+    for size in (8, 11, 16):
+        pdf = _document(size)
+        for w in (40, 95.5, pdf.w - pdf.l_margin - pdf.r_margin):
+            # The width safe_multi_cell wraps to: multi_cell's width less its cell margins.
+            lines = wrap_text(pdf, TEXT, w - 2 * pdf.c_margin)
+            assert len(lines) > 1
+            laid_out = pdf.multi_cell(w, 8, "\n".join(lines), dry_run=True, output="LINES")
+            assert laid_out == lines, f"size {size}, width {w}"
+
+
+def test_wrap_text_breaks_long_words():
+    pdf = _document(11)
+    width = 30
+    lines = wrap_text(pdf, "x" * 200 + " tail", width)
+    assert "".join(lines[:-1]) + lines[-1].replace(" tail", "") == "x" * 200
+    assert all(pdf.get_string_width(line) <= width for line in lines)
+
+
+def test_wrap_text_spaces():
+    pdf = _document(11)
+    assert wrap_text(pdf, "", 100) == []
+    assert wrap_text(pdf, "  two   words ", 100) == ["two words"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,91 @@
+import os
+import time
+import sqlite3
+import tempfile
+
+from utils import cache
+from utils.cache import TieredCache
+from services.envirotrust import CircuitBreaker
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()  # a success resets the count
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    # Half open: one trial call goes through, the rest wait for its outcome.
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()  # the trial failed: open again, for a full reset_timeout
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()  # the trial succeeded: closed
+    assert breaker.allow() and breaker.allow()
+
+
+def _disk_keys(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT key FROM cache ORDER BY stored_at")]
+    finally:
+        conn.close()
+
+
+def test_cache_disk_expiry():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        TieredCache(path).set("short", "v", ttl=0.05)
+        TieredCache(path).set("forever", "v")
+        time.sleep(0.06)
+        fresh = TieredCache(path)  # empty memory tier, so lookups go to the file
+        assert fresh.get("short") is None
+        assert fresh.get("forever") == "v"
+        # Expired rows are deleted when the file is next pruned (on a new instance's first write).
+        fresh.set("other", "v")
+        assert sorted(_disk_keys(path)) == ["forever", "other"]
+
+
+def test_cache_disk_bounds():
+    saved = cache.DISK_PRUNE_WRITES
+    cache.DISK_PRUNE_WRITES = 1
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            blob = "x" * 38  # 40 bytes as JSON
+            by_bytes = TieredCache(path, max_entries=100, disk_max_bytes=100)
+            for i in range(5):
+                by_bytes.set(f"k{i}", blob)
+            assert _disk_keys(path) == ["k3", "k4"]
+            assert by_bytes.stats()["disk_evictions"] == 3
+
+            by_count = TieredCache(path, max_entries=3)
+            for i in range(5, 10):
+                by_count.set(f"k{i}", "v")
+            assert _disk_keys(path) == ["k7", "k8", "k9"]
+            # Rewriting a key makes it the newest.
+            by_count.set("k7", "v")
+            by_count.set("k10", "v")
+            assert _disk_keys(path) == ["k9", "k7", "k10"]
+    finally:
+        cache.DISK_PRUNE_WRITES = saved
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from utils import jsonstream
+from services.normalize import lttb_indices, downsample
+
+# Strings that end, escape or look like JSON syntax, so some chunk boundary falls inside each.
+TRICKY = ['a"}b', "x,y]", 'q\\"', "back\\slash", "café", "€\U0001F525", "tab\tnl\n", "}{][", ""]
+DOC = {
+    "series": [{"date": f"2024-01-{i + 1:02d}", "value": -1.5 - i, "note": TRICKY[i % len(TRICKY)]} for i in range(12)],
+    "meta": {"unit": "°C", "source": "a\\b\"c"},
+    "by_year": {str(2000 + i): {"p50": i * 0.25, "tag": TRICKY[-i]} for i in range(6)},
+}
+
+
+def chunked(blob: bytes, size: int):
+    return [blob[i:i + size] for i in range(0, len(blob), size)]
+
+
+def test_jsonstream_chunk_boundaries():
+    # ensure_ascii=False keeps multibyte UTF-8, so some cuts split a character as well.
+    for text in (json.dumps(DOC, ensure_ascii=False), json.dumps(DOC, indent=1)):
+        blob = text.encode("utf-8")
+        for size in range(1, 40):
+            assert jsonstream.load(chunked(blob, size)) == DOC, f"chunk size {size}"
+        assert jsonstream.load([blob]) == DOC
+
+
+def test_jsonstream_numbers_across_chunks():
+    blob = b"[-1.5e3, 12345, 0.125, true, null]"
+    for size in range(1, len(blob)):
+        assert jsonstream.load(chunked(blob, size)) == [-1500.0, 12345, 0.125, True, None]
+
+
+def test_jsonstream_tail_window():
+    blob = json.dumps(DOC).encode("utf-8")
+    for size in (1, 7, 64, len(blob)):
+        doc = jsonstream.load(chunked(blob, size), tails={"series": 3, "by_year": 2})
+        assert doc["series"] == DOC["series"][-3:]
+        assert list(doc["by_year"]) == ["2004", "2005"]
+        assert doc["by_year"]["2005"] == DOC["by_year"]["2005"]
+        assert doc["meta"] == DOC["meta"]
+
+    # A bare top-level array is trimmed by tails[None]; a window longer than the data keeps it all.
+    blob = json.dumps(DOC["series"]).encode("utf-8")
+    assert jsonstream.load(chunked(blob, 5), tails={None: 4}) == DOC["series"][-4:]
+    assert jsonstream.load(chunked(blob, 5), tails={None: 100}) == DOC["series"]
+
+
+def test_jsonstream_malformed():
+    for bad in (b'{"series": [1, 2', b'{"series": [1 2]}', b'[{"a": 1}] x', b'{"a": "open', b""):
+        for size in (1, 3, 100):
+            try:
+                jsonstream.load(chunked(bad, size))
+            except ValueError:
+                continue
+            raise AssertionError(f"{bad!r} parsed in chunks of {size}")
+
+
+def test_lttb_endpoints_and_extremes():
+    rng = np.random.default_rng(0)
+    y = rng.normal(0, 1, 5000)
+    y[1234], y[3777] = 50.0, -50.0
+    for threshold in (3, 10, 120, 999):
+        keep = lttb_indices(y, threshold)
+        assert len(keep) == threshold
+        assert keep[0] == 0 and keep[-1] == len(y) - 1
+        assert np.all(np.diff(keep) > 0), "indices must be sorted and unique"
+        if threshold >= 10:
+            assert 1234 in keep and 3777 in keep
+
+
+def test_lttb_short_series():
+    y = np.arange(10.0)
+    assert list(lttb_indices(y, 10)) == list(range(10))
+    assert list(lttb_indices(y, 50)) == list(range(10))
+    assert list(lttb_indices(y, 2)) == list(range(10))
+
+
+def test_downsample():
+    n = 1000
+    df = pd.DataFrame({"a": np.sin(np.arange(n) / 20.0), "b": np.arange(n, dtype=float)})
+    df.loc[500, "b"] = 1e6
+
+    assert len(downsample(df.head(50), ["a", "b"], 120)) == 50
+    small = downsample(df, ["a", "b"], 120)
+    assert len(small) <= 120
+    assert small.index[0] == 0 and small.index[-1] == n - 1
+    assert 500 in small.index
+    assert small.index.is_monotonic_increasing
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# The SQLite tier drops expired rows and enforces its bounds once per this many
+# writes, or this many seconds, rather than on every write.
+DISK_PRUNE_WRITES = 64
+DISK_PRUNE_SECONDS = 60.0
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(blob: bytes):
+    return json.loads(blob)
+
+
+class TieredCache:
+    """
+    Key/value cache with an in-process LRU tier in front of an optional SQLite file.
+
+    Values are stored serialized (JSON by default), so callers always get a fresh copy
+    and can't corrupt cached entries by mutating what they receive. Every entry has its
+    own TTL in seconds (None never expires). The memory tier is bounded by entry count
+    and, optionally, by total serialized size. The SQLite tier is shared by every
+    process that opens the same path; it is bounded by `disk_max_entries` and
+    `disk_max_bytes` (by default the memory tier's bounds), oldest writes evicted first.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 1024, max_bytes: int = None,
+                 dumps=_json_dumps, loads=_json_loads, disk_max_entries: int = None, disk_max_bytes: int = None):
+        self.path = path or None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries if disk_max_entries is not None else max_entries
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else max_bytes
+        self._dumps = dumps
+        self._loads = loads
+        self._memory = OrderedDict()  # key -> (blob, expires_at)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._disk_writes = 0
+        self._disk_pruned_at = 0.0
+        self.counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0,
+                         "disk_evictions": 0}
+
+    # -------------------------
+    # SQLite tier
+    # -------------------------
+    def _db(self):
+        if self.path is None:
+            return None
+        # A connection must not cross a fork; reopen in child processes.
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, "
+                "stored_at REAL NOT NULL DEFAULT 0, size INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+            if "stored_at" not in columns:
+                # Files written before the disk tier was bounded: their rows count as the oldest.
+                conn.execute("ALTER TABLE cache ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+            if "size" not in columns:
+                conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE cache SET size = length(value)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _disk_get(self, key):
+        try:
+            db = self._db()
+            if db is None:
+                return None
+            row = db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Cache read from {self.path} failed: {e}")
+            return None
+        if row is None:
+            return None
+        blob, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return bytes(blob), expires_at
+
+    def _disk_set(self, key, blob, expires_at):
+        try:
+            db = self._db()
+            if db is None:
+                return
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, stored_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(blob), expires_at, now, len(blob)),
+            )
+            self._disk_writes += 1
+            if self._disk_writes >= DISK_PRUNE_WRITES or now - self._disk_pruned_at >= DISK_PRUNE_SECONDS:
+                self._disk_prune(db, now)
+        except sqlite3.Error as e:
+            logging.warning(f"Cache write to {self.path} failed: {e}")
+
+    def _disk_prune(self, db, now):
+        """Delete expired rows, then the oldest rows beyond `disk_max_entries` / `disk_max_bytes`."""
+        self._disk_writes, self._disk_pruned_at = 0, now
+        removed = db.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+        max_entries = self.disk_max_entries if self.disk_max_entries is not None else -1
+        max_bytes = self.disk_max_bytes if self.disk_max_bytes is not None else -1
+        if max_entries >= 0 or max_bytes >= 0:
+            # Keep the newest rows while both running totals stay within the bounds.
+            evicted = db.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, ROW_NUMBER() OVER newest AS n, SUM(size) OVER newest AS total FROM cache
+                        WINDOW newest AS (ORDER BY stored_at DESC, rowid DESC)
+                    )
+                    WHERE (? >= 0 AND n > ?) OR (? >= 0 AND total > ?)
+                )
+                """,
+                (max_entries, max_entries, max_bytes, max_bytes),
+            ).rowcount
+            self.counters["disk_evictions"] += evicted
+            removed += evicted
+        if removed:
+            logging.debug(f"Pruned {removed} rows from {self.path}")
+
+    # -------------------------
+    # Memory tier
+    # -------------------------
+    def _remember(self, key, blob, expires_at):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[0])
+        self._memory[key] = (blob, expires_at)
+        self._memory_bytes += len(blob)
+        while self._memory and (
+            len(self._memory) > self.max_entries
+            or (self.max_bytes is not None and self._memory_bytes > self.max_bytes)
+        ):
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self._memory.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return self._loads(entry[0])
+            if entry is not None:
+                self._memory_bytes -= len(entry[0])
+                del self._memory[key]
+            found = self._disk_get(key)
+            if found is None:
+                self.counters["misses"] += 1
+                return default
+            self._remember(key, *found)
+            self.counters["hits"] += 1
+            self.counters["disk_hits"] += 1
+        return self._loads(found[0])
+
+    def set(self, key, value, ttl: float = None):
+        blob = self._dumps(value)
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._remember(key, blob, expires_at)
+            self._disk_set(key, blob, expires_at)
+            self.counters["sets"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= len(entry[0])
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            except sqlite3.Error as e:
+                logging.warning(f"Cache delete from {self.path} failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute("DELETE FROM cache")
+            except sqlite3.Error as e:
+                logging.warning(f"Cache clear of {self.path} failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
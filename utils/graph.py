@@ -0,0 +1,115 @@
+"""
+Dependency-graph stage runner.
+
+Stages are declared with the stages they depend on and run on a thread pool as soon
+as those have finished, so independent work overlaps instead of running in fixed
+phases. After a run, critical_path() names the chain of stages that determined the
+total latency.
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils import metrics
+
+
+class StageGraph:
+    """
+    add(name, fn, deps) declares a stage; fn is called with the results of `deps`, in
+    order. run() returns every stage's result and records when each one started and
+    finished. The first stage to raise stops the run: stages that haven't started are
+    dropped, running ones are left to finish in the background, and the error is
+    re-raised.
+    """
+
+    def __init__(self, name="graph"):
+        self.name = name
+        self._stages = {}  # name -> (fn, deps)
+        self.results = {}
+        self.timings = {}  # name -> (start, end), seconds since the run started
+        self.elapsed = None
+
+    def add(self, name, fn, deps=()):
+        if name in self._stages:
+            raise ValueError(f"Stage {name!r} is already defined")
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            # Requiring dependencies first also rules out cycles.
+            raise ValueError(f"Stage {name!r} depends on undefined stages: {', '.join(missing)}")
+        self._stages[name] = (fn, tuple(deps))
+        return name
+
+    def _call(self, name, started):
+        fn, deps = self._stages[name]
+        start = time.perf_counter() - started
+        try:
+            with metrics.span("graph_stage", graph=self.name, node=name):
+                return fn(*(self.results[dep] for dep in deps))
+        finally:
+            self.timings[name] = (start, time.perf_counter() - started)
+
+    def run(self, max_workers=None, on_done=None):
+        """
+        Run every stage. `on_done(name, result)` is called from the calling thread as
+        each stage finishes. Returns the results by stage name.
+        """
+        self.results, self.timings = {}, {}
+        waiting = {name: set(deps) for name, (_, deps) in self._stages.items()}
+        dependents = {name: [] for name in self._stages}
+        for name, (_, deps) in self._stages.items():
+            for dep in deps:
+                dependents[dep].append(name)
+
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(self._stages) or 1,
+                                      thread_name_prefix=self.name)
+        running = {}
+
+        def submit_ready():
+            for name in [n for n, deps in waiting.items() if not deps]:
+                del waiting[name]
+                running[executor.submit(self._call, name, started)] = name
+
+        try:
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    self.results[name] = future.result()
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                    if on_done is not None:
+                        on_done(name, self.results[name])
+                submit_ready()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.elapsed = time.perf_counter() - started
+        return self.results
+
+    def critical_path(self, target=None):
+        """
+        The chain of stages ending at `target` (default: the stage that finished last)
+        in which each stage's latest-finishing dependency is its predecessor.
+        """
+        if not self.timings:
+            return []
+        name = target or max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            deps = [dep for dep in self._stages[name][1] if dep in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda dep: self.timings[dep][1])
+            path.append(name)
+        return path[::-1]
+
+    def describe_critical_path(self, target=None) -> str:
+        path = self.critical_path(target)
+        steps = [f"{name} {self.timings[name][1] - self.timings[name][0]:.2f}s" for name in path]
+        total = self.timings[path[-1]][1] if path else 0.0
+        return f"{' -> '.join(steps)} (finished at {total:.2f}s)"
+
+    def log_summary(self):
+        logging.info(f"{self.name}: {len(self.timings)} stages in {self.elapsed:.2f}s")
+        logging.info(f"{self.name} critical path: {self.describe_critical_path()}")
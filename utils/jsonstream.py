@@ -0,0 +1,177 @@
+"""
+Incremental JSON parsing of timeseries payloads.
+
+load() reads a JSON document from an iterable of byte chunks, such as
+requests' Response.iter_content(), without holding the whole body. Top-level
+arrays, and objects nested one level down (as in {"series": [...]} or
+{"series": {"2001": {...}}}), are decoded as their records arrive, so a `tails`
+window can drop everything but the trailing records while they stream by.
+
+Records are decoded by the C json scanner, a buffer at a time where possible:
+the buffered text up to its last "}" is wrapped in brackets and decoded in one
+call. That only parses when the "}" closes a record, since a cut anywhere inside
+one leaves a bracket or string open; otherwise the records are decoded one by one.
+"""
+import re
+import json
+import codecs
+from collections import deque
+
+_decoder = json.JSONDecoder()
+_skip_whitespace = re.compile(r"[ \t\n\r]*").match
+_NUMBER_CHARS = "0123456789+-.eE"
+_CLOSE = {"[": "]", "{": "}"}
+
+
+class _Reader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self._batch_failed = False
+        self._keys = {}
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer, dropping what has been consumed. False at the end."""
+        if self.eof:
+            return False
+        self._batch_failed = False
+        for chunk in self._chunks:
+            if chunk:
+                self.bytes_read += len(chunk)
+                self.buf = self.buf[self.pos:] + self._utf8.decode(chunk)
+                self.pos = 0
+                return True
+        self.buf = self.buf[self.pos:] + self._utf8.decode(b"", final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or "" at the end of the input."""
+        while True:
+            self.pos = _skip_whitespace(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.bytes_read}, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value, reading more input until it is."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number cut off by the end of the buffer ("-1." of "-1.5") may continue in the next chunk.
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if number and not self.eof and (end == len(self.buf) or self.buf[end] in _NUMBER_CHARS) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def record(self):
+        """Like value(), reusing one string object per distinct key of an object record."""
+        value = self.value()
+        if isinstance(value, dict):
+            keys = self._keys
+            return {keys.setdefault(k, k): v for k, v in value.items()}
+        return value
+
+    def batch(self, opening):
+        """
+        Every complete object record in the buffer, decoded in one call as members of
+        an `opening` ("[" or "{") container; None when the buffer doesn't end in one.
+        """
+        if self._batch_failed:
+            return None
+        end = self.buf.rfind("}", self.pos)
+        if end < 0:
+            return None
+        try:
+            members = _decoder.decode(opening + self.buf[self.pos:end + 1] + _CLOSE[opening])
+        except json.JSONDecodeError:
+            # Decode one record at a time until the next chunk arrives.
+            self._batch_failed = True
+            return None
+        self.pos = end + 1
+        return members
+
+
+def _members(reader, close, item):
+    """Yield item() for each member of an array or object whose opening bracket has been read."""
+    if reader.peek() == close:
+        reader.pos += 1
+        return
+    while True:
+        yield item()
+        sep = reader.peek()
+        reader.pos += 1
+        if sep == close:
+            return
+        if sep != ",":
+            raise ValueError(f"Expected ',' or {close!r} at offset {reader.bytes_read}, found {sep or 'end of input'!r}")
+
+
+def _pair(reader):
+    key = reader.value()
+    reader.expect(":")
+    return key, reader.record()
+
+
+def _records(reader, opening):
+    """Batches of records (values, or (key, value) pairs) of a container whose opening bracket has been read."""
+    single = reader.record if opening == "[" else lambda: _pair(reader)
+    for _ in _members(reader, _CLOSE[opening], lambda: None):
+        batch = reader.batch(opening)
+        if batch is None:
+            yield [single()]
+        else:
+            yield batch if opening == "[" else batch.items()
+
+
+def _container(reader, tail=None):
+    """The array or object at the reader, decoded as records arrive, keeping the last `tail` if given."""
+    opening = reader.peek()
+    if opening not in _CLOSE:
+        return reader.value()
+    reader.pos += 1
+    records = deque(maxlen=tail)
+    for batch in _records(reader, opening):
+        records.extend(batch)
+    return list(records) if opening == "[" else dict(records)
+
+
+def load(chunks, tails=None):
+    """
+    Parse a JSON document from byte chunks. `tails` maps a top-level key to the
+    number of trailing records to keep from its array or object; a bare top-level
+    array is trimmed by tails[None]. Keys not in `tails` are kept whole.
+    """
+    tails = tails or {}
+    reader = _Reader(chunks)
+    start = reader.peek()
+    if start == "[":
+        doc = _container(reader, tails.get(None))
+    elif start == "{":
+        reader.pos += 1
+        doc = {}
+        for key, _ in _members(reader, "}", lambda: (reader.value(), reader.expect(":"))):
+            doc[key] = _container(reader, tails.get(key))
+    else:
+        doc = reader.value()
+    if reader.peek():
+        raise ValueError(f"Extra data after the JSON document at offset {reader.bytes_read}")
+    return doc
@@ -0,0 +1,241 @@
+"""
+Lightweight stage instrumentation.
+
+Wrap work in `span("stage", label=value)` (or decorate it with `traced`) to record its
+duration, errors, payload bytes, LLM tokens and cache hits in an in-process registry.
+The registry is exported in Prometheus text or OpenMetrics format by
+export_prometheus() or over HTTP by start_http_server(). When the opentelemetry-api
+package is installed, every span is also started as an OpenTelemetry span
+(METRICS_OTEL=0 turns that off).
+"""
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+OTEL_ENABLED = otel_trace is not None and os.getenv("METRICS_OTEL", "1") != "0"
+PREFIX = "climatelens"
+# Upper bounds in seconds; spans range from cached lookups to multi-minute LLM calls.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+HELP = {
+    "stage_duration_seconds": "Duration of instrumented stages.",
+    "stage_errors": "Stages that raised an exception.",
+    "stage_bytes": "Payload bytes produced or received by a stage.",
+    "stage_tokens": "LLM tokens used by a stage.",
+    "cache_lookups": "Cache lookups by result (hit or miss).",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by (name, sorted label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}  # key -> [bucket counts..., sum]
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(BUCKETS) + [0.0]
+            hist[bisect.bisect_left(BUCKETS, value)] += 1
+            hist[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def drain(self) -> dict:
+        """Return everything recorded so far and reset; pass the result to merge() in another process."""
+        with self._lock:
+            state = {"counters": list(self._counters.items()), "histograms": list(self._histograms.items())}
+            self._counters, self._histograms = {}, {}
+        return state
+
+    def merge(self, state: dict):
+        with self._lock:
+            for key, value in state["counters"]:
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, hist in state["histograms"]:
+                mine = self._histograms.setdefault(key, [0] * len(BUCKETS) + [0.0])
+                for i, value in enumerate(hist):
+                    mine[i] += value
+
+    def export(self, openmetrics=False) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(hist)) for key, hist in self._histograms.items())
+
+        lines, described = [], set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            # OpenMetrics names the counter family without its _total suffix.
+            family = f"{PREFIX}_{name}" if openmetrics or kind != "counter" else f"{PREFIX}_{name}_total"
+            lines.append(f"# HELP {family} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {family} {kind}")
+
+        for (name, labels), hist in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(
+                    f"{PREFIX}_{name}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {cumulative}"
+                )
+            lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {_format_value(hist[-1])}")
+            lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {cumulative}")
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{PREFIX}_{name}_total{_format_labels(labels)} {_format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# -------------------------
+# Recording
+# -------------------------
+def record(stage, seconds, error=None, labels=None, **attrs):
+    """
+    Record one finished stage. `error` is the exception type name, if any. Recognised
+    attributes: bytes, tokens, and cache ("hit" or "miss").
+    """
+    labels = tuple(sorted({"stage": stage, **{k: str(v) for k, v in (labels or {}).items()}}.items()))
+    REGISTRY.observe("stage_duration_seconds", labels, seconds)
+    if error:
+        REGISTRY.inc("stage_errors", labels + (("error", error),))
+    if attrs.get("bytes"):
+        REGISTRY.inc("stage_bytes", labels, attrs["bytes"])
+    if attrs.get("tokens"):
+        REGISTRY.inc("stage_tokens", labels, attrs["tokens"])
+    if attrs.get("cache"):
+        REGISTRY.inc("cache_lookups", labels + (("result", attrs["cache"]),))
+
+
+class Span:
+    """Handle yielded by span(); set() attaches bytes, tokens, cache and other attributes."""
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.attrs = {}
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+if OTEL_ENABLED:
+    _tracer = otel_trace.get_tracer(PREFIX)
+
+
+@contextlib.contextmanager
+def span(stage, **labels):
+    """Time the enclosed block as `stage`; exceptions are counted and re-raised."""
+    sp = Span(stage, labels)
+    otel_span = _tracer.start_as_current_span(stage, attributes=labels) if OTEL_ENABLED else contextlib.nullcontext()
+    error = None
+    with otel_span as current:
+        start = time.perf_counter()
+        try:
+            yield sp
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record(stage, time.perf_counter() - start, error=error, labels=labels, **sp.attrs)
+            if current is not None:
+                current.set_attributes({k: v for k, v in sp.attrs.items() if isinstance(v, (str, bool, int, float))})
+
+
+def traced(stage, **labels):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -------------------------
+# Export
+# -------------------------
+def export_prometheus(openmetrics: bool = False) -> str:
+    """Every metric recorded in this process, in Prometheus text (or OpenMetrics) format."""
+    return REGISTRY.export(openmetrics)
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0", collect=None):
+    """
+    Serve /metrics from a daemon thread; OpenMetrics when the scraper asks for it.
+    `collect` is called before every scrape, e.g. to merge metrics from other processes.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            if collect is not None:
+                try:
+                    collect()
+                except Exception as e:
+                    logging.warning(f"Could not collect metrics: {e}")
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = export_prometheus(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header(
+                "Content-Type",
+                "application/openmetrics-text; version=1.0.0; charset=utf-8" if openmetrics
+                else "text/plain; version=0.0.4; charset=utf-8",
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,78 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` acquisitions per second with bursts up to `capacity`.
+
+    With a `path`, the bucket state lives in a SQLite file so every thread and process
+    that opens the same path and `name` shares one budget. Without a path it is
+    shared by the threads of the current process only.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, path: str = None, name: str = "default"):
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path or None
+        self.name = name
+        self._tokens = capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+                )
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _take(self, tokens, updated):
+        """Refill and try to take one token. Returns (tokens, updated, seconds to wait)."""
+        now = time.time()
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0.0
+        return tokens, now, (1 - tokens) / self.rate
+
+    def _try_acquire_shared(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens, updated = row if row else (self.capacity, time.time())
+            tokens, updated, wait = self._take(tokens, updated)
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, tokens, updated),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _try_acquire_local(self):
+        with self._lock:
+            self._tokens, self._updated, wait = self._take(self._tokens, self._updated)
+            return wait
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            wait = self._try_acquire_shared() if self.path else self._try_acquire_local()
+            if wait <= 0:
+                return
+            time.sleep(wait)
@@ -0,0 +1,187 @@
+"""
+Spatial tiling of portfolio locations.
+
+EnviroTrust risk grids are much coarser than the distance between neighbouring
+properties, so a portfolio only needs one fetch per grid tile. TileIndex groups points
+into geohash cells and, with a `snap` distance, merges each cell into the most populous
+cell whose center lies within it. A small KD-tree over the cell centers finds those
+neighbours, so properties on either side of a cell border can share one tile. Every
+tile is fetched once, at its center.
+
+A report built from a tile's data describes its center, not the property itself, so
+tiling is off by default. Even precision 7 cells are wider than the 0.001 degree grid
+(about 110 m) the EnviroTrust response cache treats as one place.
+"""
+import os
+import math
+
+import numpy as np
+
+# 0 turns tiling off. Precision 7 cells are about 150 x 150 m (at the equator; narrower in
+# longitude further north), precision 8 cells about 38 x 19 m.
+TILE_PRECISION = int(os.getenv("SPATIAL_TILE_PRECISION", "0"))
+# Cells whose centers are within this many meters of a busier cell join its tile; 0 turns merging off.
+TILE_SNAP = float(os.getenv("SPATIAL_TILE_SNAP", "0"))
+
+EARTH_RADIUS = 6371008.8  # meters
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+
+# -------------------------
+# Geohash
+# -------------------------
+def geohash_encode(lat: float, lon: float, precision: int = TILE_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, x = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if x >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _BASE32_INDEX[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geohash_center(geohash: str):
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    return round((min_lat + max_lat) / 2, 6), round((min_lon + max_lon) / 2, 6)
+
+
+def _to_xyz(points):
+    """(lat, lon) pairs as points on a sphere of the earth's radius; chord length ~ distance at these scales."""
+    pts = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat, lon = pts[:, 0], pts[:, 1]
+    return EARTH_RADIUS * np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def distance_m(a, b) -> float:
+    """Great-circle distance in meters between two (lat, lon) points."""
+    chord = float(np.linalg.norm(_to_xyz([a])[0] - _to_xyz([b])[0]))
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, chord / (2 * EARTH_RADIUS)))
+
+
+# -------------------------
+# KD-tree
+# -------------------------
+class KDTree:
+    """Static KD-tree over (lat, lon) points answering radius queries."""
+
+    def __init__(self, points):
+        self._xyz = _to_xyz(points)
+        self._root = self._build(np.arange(len(self._xyz)), 0)
+
+    def _build(self, idx, depth):
+        if len(idx) == 0:
+            return None
+        axis = depth % 3
+        idx = idx[np.argsort(self._xyz[idx, axis], kind="stable")]
+        mid = len(idx) // 2
+        # node: (point index, split axis, left, right)
+        return (int(idx[mid]), axis, self._build(idx[:mid], depth + 1), self._build(idx[mid + 1:], depth + 1))
+
+    def within(self, lat, lon, radius):
+        """Indices of the points within `radius` meters, in no particular order."""
+        target = _to_xyz([(lat, lon)])[0]
+        found = []
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            if np.linalg.norm(self._xyz[i] - target) <= radius:
+                found.append(i)
+            diff = target[axis] - self._xyz[i, axis]
+            if diff - radius <= 0:
+                visit(left)
+            if diff + radius >= 0:
+                visit(right)
+
+        visit(self._root)
+        return found
+
+
+# -------------------------
+# Tile index
+# -------------------------
+class TileIndex:
+    """
+    Groups (lat, lon) points into tiles. `tiles` maps tile id -> indices of its points,
+    `tile_of[i]` is the tile of point i and center(tile) is where the tile is fetched.
+    Tiles are ordered busiest first.
+    """
+
+    def __init__(self, points, precision: int = TILE_PRECISION, snap: float = TILE_SNAP):
+        self.precision = precision
+        self.snap = snap
+        cells = {}
+        for i, (lat, lon) in enumerate(points):
+            cells.setdefault(geohash_encode(lat, lon, precision), []).append(i)
+
+        # Busiest cells claim their neighbours first, so tiles form around dense spots.
+        names = sorted(cells, key=lambda c: (-len(cells[c]), c))
+        centers = [geohash_center(c) for c in names]
+        tree = KDTree(centers) if snap > 0 and names else None
+        tile_of_cell = {}
+        for name, (lat, lon) in zip(names, centers):
+            if name in tile_of_cell:
+                continue
+            tile_of_cell[name] = name
+            if tree is not None:
+                for j in tree.within(lat, lon, snap):
+                    tile_of_cell.setdefault(names[j], name)
+
+        self.tiles = {}
+        for name in names:
+            self.tiles.setdefault(tile_of_cell[name], []).extend(cells[name])
+        self.tiles = dict(sorted(self.tiles.items(), key=lambda item: (-len(item[1]), item[0])))
+        self.tile_of = [None] * len(points)
+        for tile, members in self.tiles.items():
+            members.sort()
+            for i in members:
+                self.tile_of[i] = tile
+
+    def __len__(self):
+        return len(self.tiles)
+
+    @staticmethod
+    def center(tile):
+        return geohash_center(tile)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Points per tile: how many times fewer fetches than one per point."""
+        return len(self.tile_of) / len(self.tiles) if self.tiles else 1.0
+
+    def stats(self) -> dict:
+        return {
+            "points": len(self.tile_of),
+            "tiles": len(self.tiles),
+            "dedup_ratio": round(self.dedup_ratio, 2),
+            "largest_tile": max((len(m) for m in self.tiles.values()), default=0),
+        }
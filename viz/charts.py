@@ -1,41 +1,162 @@
 import os
+import json
+import time
+import atexit
+import hashlib
+import functools
 import tempfile
-import matplotlib.pyplot as plt
+import threading
+import multiprocessing
+from io import BytesIO
+from typing import Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
-import pandas as pd
 import matplotlib.ticker as ticker
 import matplotlib.dates as mdates
 
-# Global style settings
-sns.set_theme(style="whitegrid")
-PALETTE = sns.color_palette("viridis", 8)
+from utils.cache import TieredCache
+from utils import metrics
+from services import normalize
 
-def _save_current_fig(title):
-    """Save current matplotlib figure to a temporary file and return its path."""
-    tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    path = tmp.name
-    tmp.close()
+# Global style settings, applied by init_style() before the first chart is drawn rather
+# than on import, so importing this module doesn't change matplotlib's global state.
+PALETTE = None
+_style_lock = threading.Lock()
+
+def init_style():
+    global PALETTE
+    with _style_lock:
+        if PALETTE is None:
+            sns.set_theme(style="whitegrid")
+            PALETTE = sns.color_palette("viridis", 8)
+
+# Charts are drawn on standalone Agg figures rather than through pyplot, whose
+# global "current figure" state is not thread-safe. Each thread keeps one figure
+# per size and clears it between charts instead of building a new one.
+_figures = threading.local()
+# Output format of the chart being drawn on this thread, set by _cached_chart.
+_render = threading.local()
+CHART_FORMATS = ("png", "svg")
+# fpdf2 skips, with a warning per chart, the <metadata> element matplotlib writes into SVGs.
+SVG_NO_METADATA = {"Date": None, "Creator": None, "Format": None, "Type": None}
+
+def _acquire_figure(figsize):
+    pool = getattr(_figures, "by_size", None)
+    if pool is None:
+        pool = _figures.by_size = {}
+    fig = pool.get(figsize)
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        pool[figsize] = fig
+    return fig
+
+def _save_fig(fig, title) -> bytes:
+    """Render a figure to PNG (or SVG, see _cached_chart) bytes and clear it for reuse."""
     try:
-        plt.suptitle(title, fontsize=18, weight="bold", y=1.02)
-        plt.savefig(path, dpi=150, bbox_inches="tight")
+        fig.suptitle(title, fontsize=18, weight="bold", y=1.02)
+        buf = BytesIO()
+        fmt = getattr(_render, "fmt", "png")
+        metadata = SVG_NO_METADATA if fmt == "svg" else None
+        fig.savefig(buf, format=fmt, dpi=150, bbox_inches="tight", metadata=metadata)
+        return buf.getvalue()
     finally:
-        plt.close()
-    return path
+        fig.clear()
+
+def _to_output(png, in_memory, fmt="png"):
+    """Return chart bytes as-is, or write them to a temporary file the caller owns (see discard_charts)."""
+    if in_memory:
+        return png
+    with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
+        tmp.write(png)
+    return tmp.name
+
+def discard_charts(charts: dict):
+    """Delete the temporary files behind path-based charts; in-memory charts need nothing."""
+    for chart in charts.values():
+        if isinstance(chart, str) and os.path.exists(chart):
+            os.remove(chart)
+
+def _rotate_xticks(ax):
+    ax.tick_params(axis="x", labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+
+EMPTY_FIGSIZE = (6.4, 4.8)
+
+# -------------------------
+# Chart cache
+# -------------------------
+# Rendered charts are cached under a hash of (chart, STYLE_VERSION, normalize.MAX_POINTS,
+# format, input data), so identical payloads never reach matplotlib twice. Bump
+# STYLE_VERSION whenever a change to this module or to services/normalize.py alters
+# how charts look.
+STYLE_VERSION = 3  # 2: long series downsampled with LTTB; 3: SVGs without <metadata>
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Set to a SQLite file path to keep rendered charts across processes and restarts.
+CHART_CACHE_PATH = os.getenv("CHART_CACHE_PATH", "")
+
+_chart_cache = None
+
+def get_chart_cache() -> TieredCache:
+    global _chart_cache
+    if _chart_cache is None:
+        _chart_cache = TieredCache(
+            path=CHART_CACHE_PATH, max_entries=4096, max_bytes=CHART_CACHE_MAX_BYTES, dumps=bytes, loads=bytes
+        )
+    return _chart_cache
+
+def chart_key(kind, data, fmt="png"):
+    """Stable content hash of a chart's inputs, or None if the data can't be serialized."""
+    parts = [kind, STYLE_VERSION, normalize.MAX_POINTS, fmt, data]
+    try:
+        blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _cached_chart(kind):
+    """
+    Serve a plot function from the chart cache; it only runs on a miss. The wrapped
+    function takes `fmt`, "png" or "svg" (vector, for the PDF's vector profile).
+    """
+    def decorate(draw):
+        @functools.wraps(draw)
+        def plot(data, in_memory: bool = False, fmt: str = "png") -> Union[str, bytes]:
+            if fmt not in CHART_FORMATS:
+                raise ValueError(f"Unknown chart format {fmt!r}; expected one of {', '.join(CHART_FORMATS)}")
+            with metrics.span("chart", chart=kind) as span:
+                key = chart_key(kind, data, fmt)
+                png = get_chart_cache().get(key) if key else None
+                span.set(cache="hit" if png is not None else "miss")
+                if png is None:
+                    init_style()
+                    _render.fmt = fmt
+                    try:
+                        png = draw(data)
+                    finally:
+                        _render.fmt = "png"
+                    if key:
+                        get_chart_cache().set(key, png)
+                span.set(bytes=len(png))
+                return _to_output(png, in_memory, fmt)
+        return plot
+    return decorate
 
 # -------------------------
 # Risk Score Bar
 # -------------------------
-def plot_risk_score_bar(risk_score) -> str:
-    scores = risk_score.get("scores", {}) if isinstance(risk_score, dict) else {}
+@_cached_chart("risk_bar")
+def plot_risk_score_bar(risk_score):
+    scores = normalize.risk_scores(risk_score)
     labels = ["Air Quality", "Flood", "Wildfire"]
-    vals = [
-        scores.get("air_quality", 0) or 0,
-        scores.get("flood_risk", 0) or 0,
-        scores.get("wildfire_risk", 0) or 0,
-    ]
-
-    plt.figure(figsize=(8, 5))
-    ax = sns.barplot(x=labels, y=vals, palette=PALETTE, width=0.6)
+    vals = [scores[key] or 0 for key in normalize.RISK_SCORE_KEYS]
+
+    fig = _acquire_figure((8, 5))
+    ax = fig.subplots()
+    sns.barplot(x=labels, y=vals, palette=PALETTE, width=0.6, ax=ax)
     ax.set_ylim(0, 10)
     ax.set_ylabel("Risk Level (0-10)", fontsize=12)
     for p in ax.patches:
@@ -48,27 +169,19 @@ def plot_risk_score_bar(risk_score) -> str:
             textcoords='offset points',
             weight="bold"
         )
-    return _save_current_fig("Composite Climate Risk Scores")
+    return _save_fig(fig, "Composite Climate Risk Scores")
 
 # -------------------------
 # Air Quality Snapshot
 # -------------------------
-def plot_air_quality_gauges(aq_data) -> str:
-    latest_aqi, latest_pm25 = 0, 0
-    items = []
-
-    if isinstance(aq_data, dict):
-        items = aq_data.get("air_quality_timeseries", [])
-    elif isinstance(aq_data, list):
-        items = aq_data
-
-    if items and isinstance(items[-1], dict):
-        last = items[-1]
-        latest_aqi = last.get("air_quality_index", 0)
-        latest_pm25 = last.get("pm2_5", 0)
-
-    plt.figure(figsize=(6, 5))
-    ax = sns.barplot(x=["AQI", "PM2.5"], y=[latest_aqi, latest_pm25], palette=PALETTE, width=0.5)
+@_cached_chart("aq_gauges")
+def plot_air_quality_gauges(aq_data):
+    latest = normalize.air_quality_latest(aq_data)
+    latest_aqi, latest_pm25 = latest["aqi"], latest["pm2_5"]
+
+    fig = _acquire_figure((6, 5))
+    ax = fig.subplots()
+    sns.barplot(x=["AQI", "PM2.5"], y=[latest_aqi, latest_pm25], palette=PALETTE, width=0.5, ax=ax)
     ax.set_ylabel("Value", fontsize=12)
     for p in ax.patches:
         ax.annotate(
@@ -80,72 +193,54 @@ def plot_air_quality_gauges(aq_data) -> str:
             textcoords='offset points',
             weight="bold"
         )
-    return _save_current_fig("Latest Air Quality Snapshot")
+    return _save_fig(fig, "Latest Air Quality Snapshot")
 
 # -------------------------
 # Wildfire Timeseries
 # -------------------------
-def plot_wildfire_timeseries(api_data) -> str:
-    wf_ts = api_data.get("wildfire_risk_timeseries_data", {})
-    df = pd.DataFrame(wf_ts).T
-    # Remove latitude and longitude columns if they exist
-    if "latitude" in df.columns:
-        df = df.drop(columns=["latitude"])
-    if "longitude" in df.columns:
-        df = df.drop(columns=["longitude"])
-    if "year" in df.columns:
-        df = df.drop(columns=["year"])
-    df = df.reset_index().rename(columns={"index": "year"})
-
+@_cached_chart("wildfire_ts")
+def plot_wildfire_timeseries(api_data):
+    df = normalize.wildfire_timeseries(api_data)
     if df.empty:
-        return _save_current_fig("Wildfire Danger Days per Year")
+        return _save_fig(_acquire_figure(EMPTY_FIGSIZE), "Wildfire Danger Days per Year")
 
+    df = df.rename_axis("year").reset_index()
     df = df.melt(id_vars="year", var_name="danger_level", value_name="days")
 
-    plt.figure(figsize=(10, 6))
-    ax = sns.lineplot(
+    fig = _acquire_figure((10, 6))
+    ax = fig.subplots()
+    sns.lineplot(
         data=df,
         x="year",
         y="days",
         hue="danger_level",
         palette=PALETTE,
         marker="o",
-        lw=2.5
+        lw=2.5,
+        ax=ax,
     )
     ax.set_xlabel("Year", fontsize=12)
     ax.set_ylabel("Number of Days", fontsize=12)
     ax.legend(title="Danger Level")
     ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True, prune='both'))
-    plt.xticks(rotation=45, ha="right")
-    return _save_current_fig("Wildfire Danger Days per Year")
+    _rotate_xticks(ax)
+    return _save_fig(fig, "Wildfire Danger Days per Year")
 
 # -------------------------
 # Heat & Wind Climate Scenarios
 # -------------------------
-def plot_heat_wind_scenarios(api_data) -> str:
-    hw_ts = api_data.get("heat_wind_timeseries_data", [])
-    df = pd.DataFrame(hw_ts)
+@_cached_chart("heatwind_scen")
+def plot_heat_wind_scenarios(api_data):
+    # Only one of each heatwaves, consecutive dry days, and extreme wind speed is plotted
+    df = normalize.heat_wind_scenarios(api_data)
     if df.empty:
-        return _save_current_fig("Heat & Wind Climate Scenarios")
-
-    # Remove 'daily max temperature' scenarios as per API documentation
-    if 'daily max temperature rcp45(K)' in df.columns:
-        df = df.drop(columns=['daily max temperature rcp45(K)'])
-    if 'daily max temperature rcp85(K)' in df.columns:
-        df = df.drop(columns=['daily max temperature rcp85(K)'])
+        return _save_fig(_acquire_figure(EMPTY_FIGSIZE), "Heat & Wind Climate Scenarios")
 
     df = df.melt(id_vars="year", var_name="scenario", value_name="days")
 
-    # Filter to plot only one of each heatwaves, consecutive dry days, and extreme wind speed
-    desired_scenarios = [
-        'heatwaves_rcp45',
-        'consecutive_dry_days_rcp45',
-        'extreme_wind_speed_days_rcp45'
-    ]
-    df = df[df['scenario'].isin(desired_scenarios)]
-
-    plt.figure(figsize=(10, 6))
-    ax = sns.lineplot(
+    fig = _acquire_figure((10, 6))
+    ax = fig.subplots()
+    sns.lineplot(
         data=df,
         x="year",
         y="days",
@@ -154,54 +249,127 @@ def plot_heat_wind_scenarios(api_data) -> str:
         palette=PALETTE,
         markers=True,
         dashes=False,
-        lw=2.5
+        lw=2.5,
+        ax=ax,
     )
     ax.set_xlabel("Year", fontsize=12)
     ax.set_ylabel("Number of Days", fontsize=12)
     ax.legend(title="Scenario")
     ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True, prune='both'))
-    plt.xticks(rotation=45, ha="right")
-    return _save_current_fig("Heat & Wind Climate Scenarios")
+    _rotate_xticks(ax)
+    return _save_fig(fig, "Heat & Wind Climate Scenarios")
 
 # -------------------------
 # Recent Daily Weather
 # -------------------------
-def plot_recent_daily_weather(hw_daily) -> str:
-    if isinstance(hw_daily, dict) and "heat_wind_daily_data" in hw_daily:
-        hw_daily = hw_daily["heat_wind_daily_data"]
-    elif not isinstance(hw_daily, list):
-        hw_daily = []
-
-    df = pd.DataFrame(hw_daily[-30:])
+@_cached_chart("recent_daily")
+def plot_recent_daily_weather(hw_daily):
+    df = normalize.recent_daily(hw_daily)
     if df.empty:
-        return _save_current_fig("Recent Daily Weather (Last 30 Days)")
-
-    # Remove 'year' column as per API documentation
-    if 'year' in df.columns:
-        df = df.drop(columns=['year'])
+        return _save_fig(_acquire_figure(EMPTY_FIGSIZE), "Recent Daily Weather (Last 30 Days)")
 
-    # Remove '2m temperature(K)' column as per user request
-    if '2m temperature(K)' in df.columns:
-        df = df.drop(columns=['2m temperature(K)'])
-
-    df["date"] = pd.to_datetime(df["date"])
     df = df.melt(id_vars="date", var_name="measurement", value_name="value")
 
-    plt.figure(figsize=(12, 6))
-    ax = sns.lineplot(
+    fig = _acquire_figure((12, 6))
+    ax = fig.subplots()
+    sns.lineplot(
         data=df,
         x="date",
         y="value",
         hue="measurement",
         palette=PALETTE,
         marker="o",
-        lw=2
+        lw=2,
+        ax=ax,
     )
 
     # Format x-axis to show month & day only
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d'))
-    plt.xticks(rotation=45, ha="right")
+    _rotate_xticks(ax)
     ax.set_xlabel("Date", fontsize=12)
     ax.set_ylabel("Value", fontsize=12)
     ax.legend(title="Measurement")
-    return _save_current_fig("Recent Daily Weather (Last 30 Days)")
+    return _save_fig(fig, "Recent Daily Weather (Last 30 Days)")
+
+# -------------------------
+# Render all charts
+# -------------------------
+CHART_FUNCTIONS = {
+    "risk_bar": plot_risk_score_bar,
+    "aq_gauges": plot_air_quality_gauges,
+    "wildfire_ts": plot_wildfire_timeseries,
+    "heatwind_scen": plot_heat_wind_scenarios,
+    "recent_daily": plot_recent_daily_weather,
+}
+
+def warm_up():
+    """
+    Pay the first-chart costs up front (style, font and glyph caches, the seaborn and
+    pandas code paths) by drawing every chart once from an empty payload, uncached.
+    """
+    init_style()
+    for plot in CHART_FUNCTIONS.values():
+        plot.__wrapped__({})
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that already runs threads (Streamlit, HTTP pools) is unsafe.
+            _pool = ProcessPoolExecutor(
+                max_workers=min(len(CHART_FUNCTIONS), os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+def _timed_render(name, data, fmt="png"):
+    start = time.perf_counter()
+    png = CHART_FUNCTIONS[name](data, in_memory=True, fmt=fmt)
+    return png, time.perf_counter() - start
+
+def render_all_charts(inputs: dict, parallel: bool = True, use_processes: bool = True, in_memory: bool = False,
+                      fmt: str = "png"):
+    """
+    Render several charts at once. `inputs` maps chart names from CHART_FUNCTIONS to
+    the payload each one is drawn from.
+
+    Returns (charts, timings): chart name -> image path (image bytes with `in_memory`)
+    and chart name -> render seconds. `fmt` is "png" or "svg".
+    Charts render in a shared process pool by default; `use_processes=False` uses
+    threads instead, and `parallel=False` renders in the calling thread, which suits
+    callers that already parallelize across reports.
+    """
+    if not parallel:
+        results = {name: _timed_render(name, data, fmt) for name, data in inputs.items()}
+    elif use_processes:
+        # Workers have their own chart caches, so consult this process's cache first.
+        cache = get_chart_cache()
+        keys = {name: chart_key(name, data, fmt) for name, data in inputs.items()}
+        results = {}
+        for name, key in keys.items():
+            png = cache.get(key) if key else None
+            if png is not None:
+                results[name] = (png, 0.0)
+        pool = _get_pool()
+        futures = {
+            name: pool.submit(_timed_render, name, data, fmt) for name, data in inputs.items() if name not in results
+        }
+        for name, future in futures.items():
+            results[name] = future.result()
+            if keys[name]:
+                cache.set(keys[name], results[name][0])
+        # Spans recorded inside worker processes stay there; record these charts here.
+        for name, (png, elapsed) in results.items():
+            metrics.record("chart", elapsed, labels={"chart": name},
+                           cache="miss" if name in futures else "hit", bytes=len(png))
+    else:
+        with ThreadPoolExecutor(max_workers=len(inputs) or 1) as pool:
+            futures = {name: pool.submit(_timed_render, name, data, fmt) for name, data in inputs.items()}
+            results = {name: future.result() for name, future in futures.items()}
+    charts = {name: _to_output(png, in_memory, fmt) for name, (png, _) in results.items()}
+    timings = {name: elapsed for name, (_, elapsed) in results.items()}
+    return charts, timings